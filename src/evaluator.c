@@ -1,89 +1,109 @@
-#include <stdio.h>
-#include <stdlib.h>
 #include <ctype.h>
+#include <float.h>
+#include <setjmp.h>
 #include <stdbool.h>
+#include <stdint.h>
+#include <stdlib.h>
 
-#include "evaluation_result.h"
-
-static void get_next_char(void);
-static long double start(void);
-static long double get_number(void);
-static long double get_term(void);
-static long double get_factor(void);
-
-static void report_invalid_expression_and_abort(void);
-static void get_next_non_whitespace_char(void);
-static void abort_if_expression_starts_with_two_unary_operators(char *);
-static void abort_if_not_end_of_expression(void);
-static void init(char *expression);
-static void skip_white_space(void);
-
-char look; // lookahead character
-char *_expression;
-bool _expression_contains_floats;
-bool _expression_contains_multiplication_or_division;
-
-evaluation_result evaluate_expression(char *expression)
+#include "libclc.h"
+
+// Largest n for which 10^n is exact in a long double: 5^n must fit in its
+// mantissa.
+#if LDBL_MANT_DIG >= 64
+#define MAX_EXACT_POWER_OF_TEN 27
+#else
+#define MAX_EXACT_POWER_OF_TEN 22
+#endif
+
+static const long double powers_of_ten[MAX_EXACT_POWER_OF_TEN+1] = {
+	1e0L, 1e1L, 1e2L, 1e3L, 1e4L, 1e5L, 1e6L, 1e7L, 1e8L, 1e9L,
+	1e10L, 1e11L, 1e12L, 1e13L, 1e14L, 1e15L, 1e16L, 1e17L, 1e18L, 1e19L,
+	1e20L, 1e21L, 1e22L,
+#if MAX_EXACT_POWER_OF_TEN > 22
+	1e23L, 1e24L, 1e25L, 1e26L, 1e27L,
+#endif
+};
+
+static void get_next_char(clc_context *ctx);
+static long double start(clc_context *ctx);
+static long double get_number(clc_context *ctx);
+static long double get_decimal_literal(clc_context *ctx);
+static bool mantissa_is_exact(uint64_t mantissa);
+static long double get_term(clc_context *ctx);
+static long double get_factor(clc_context *ctx);
+
+static void report_invalid_expression(clc_context *ctx);
+static void get_next_non_whitespace_char(clc_context *ctx);
+static void fail_if_expression_starts_with_two_unary_operators(clc_context *ctx, const char *expression);
+static void fail_if_not_end_of_expression(clc_context *ctx);
+static void init(clc_context *ctx, const char *expression);
+static void skip_white_space(clc_context *ctx);
+
+clc_error clc_evaluate(clc_context *ctx, const char *expression, evaluation_result *result)
 {
-	abort_if_expression_starts_with_two_unary_operators(expression);
-	init(expression);
-	long double answer = start();
-	abort_if_not_end_of_expression();
-
-	evaluation_result result;
-	result.answer = answer;
-	result.expression_contains_floats = _expression_contains_floats;
-	result.expression_contains_multiplication_or_division =
-		_expression_contains_multiplication_or_division;
-	return result;
+	// An invalid expression jumps back here.
+	if (setjmp(ctx->error_jmp_buf) != 0)
+		return ctx->error;
+
+	fail_if_expression_starts_with_two_unary_operators(ctx, expression);
+	init(ctx, expression);
+	long double answer = start(ctx);
+	fail_if_not_end_of_expression(ctx);
+
+	result->answer = answer;
+	result->expression_contains_floats = ctx->expression_contains_floats;
+	result->expression_contains_multiplication_or_division =
+		ctx->expression_contains_multiplication_or_division;
+	ctx->error = CLC_OK;
+	return CLC_OK;
 }
 
-static void init(char *expression)
+static void init(clc_context *ctx, const char *expression)
 {
-	_expression_contains_floats = false;
-	_expression_contains_multiplication_or_division = false;
-	_expression = expression;
-	get_next_non_whitespace_char();
+	ctx->expression_contains_floats = false;
+	ctx->expression_contains_multiplication_or_division = false;
+	ctx->expression = expression;
+	get_next_non_whitespace_char(ctx);
 }
 
-static long double start()
+static long double start(clc_context *ctx)
 {
 	long double acc = 0.0;
 
-	if (look=='+' || look=='-')
+	if (ctx->look=='+' || ctx->look=='-')
 		acc = 0.0;
 	else
-		acc = get_term();
+		acc = get_term(ctx);
 
-	while (look=='+' || look=='-')
-		switch (look) {
+	while (ctx->look=='+' || ctx->look=='-')
+		switch (ctx->look) {
 			case '+':
-				get_next_non_whitespace_char();
-				acc += get_term();
+				get_next_non_whitespace_char(ctx);
+				acc += get_term(ctx);
 				break;
 			case '-':
-				get_next_non_whitespace_char();
-				acc -= get_term();
+				get_next_non_whitespace_char(ctx);
+				acc -= get_term(ctx);
 				break;
 		}
 
 	return acc;
 }
 
-static long double get_term()
+static long double get_term(clc_context *ctx)
 {
-	long double acc = get_factor();
-	while (look=='*' || look=='/') {
-		switch (look) {
+	long double acc = get_factor(ctx);
+	while (ctx->look=='*' || ctx->look=='/') {
+		switch (ctx->look) {
 			case '*':
-				get_next_non_whitespace_char();
-				acc *= get_factor();
-				_expression_contains_multiplication_or_division = true;
+				get_next_non_whitespace_char(ctx);
+				acc *= get_factor(ctx);
+				ctx->expression_contains_multiplication_or_division = true;
 				break;
 			case '/':
-				get_next_non_whitespace_char();
-				acc /= get_factor();
-				_expression_contains_multiplication_or_division = true;
+				get_next_non_whitespace_char(ctx);
+				acc /= get_factor(ctx);
+				ctx->expression_contains_multiplication_or_division = true;
 				break;
 		}
 	}
@@ -91,107 +111,145 @@ static long double get_term()
 	return acc;
 }
 
-static long double get_factor()
+static long double get_factor(clc_context *ctx)
 {
 	long double acc = 0.0;
 
-	if (look == '(') {
-		get_next_non_whitespace_char();
-		acc = start();
-		if (look != ')')
-			report_invalid_expression_and_abort();
-		get_next_non_whitespace_char();
+	if (ctx->look == '(') {
+		get_next_non_whitespace_char(ctx);
+		acc = start(ctx);
+		if (ctx->look != ')')
+			report_invalid_expression(ctx);
+		get_next_non_whitespace_char(ctx);
 	} else
-		acc = get_number();
+		acc = get_number(ctx);
 
 	return acc;
 }
 
-static long double get_number()
+static long double get_number(clc_context *ctx)
 {
 	long double acc = 0.0;
-	int decimalPointCount = 0;
-	long double decimalPointPowerOfTen = 10.0;
-	bool unaryNegation = (look == '-');
-
-	if (look == '+' || look == '-')
-		get_next_non_whitespace_char();
-
-	if (look == '(') {
-		get_next_non_whitespace_char();
-		acc = start();
-		if (look != ')')
-			report_invalid_expression_and_abort();
-		get_next_non_whitespace_char();
+	bool unaryNegation = (ctx->look == '-');
+
+	if (ctx->look == '+' || ctx->look == '-')
+		get_next_non_whitespace_char(ctx);
+
+	if (ctx->look == '(') {
+		get_next_non_whitespace_char(ctx);
+		acc = start(ctx);
+		if (ctx->look != ')')
+			report_invalid_expression(ctx);
+		get_next_non_whitespace_char(ctx);
 		return unaryNegation ? -acc : acc;
 	}
 
-	if (!isdigit(look) && (look != '.'))
-		report_invalid_expression_and_abort();
+	if (!isdigit(ctx->look) && (ctx->look != '.'))
+		report_invalid_expression(ctx);
+
+	acc = get_decimal_literal(ctx);
+
+	skip_white_space(ctx);
 
-	while (isdigit(look) || look=='.') {
-		if (look == '.') {
+	return unaryNegation ? -acc : acc;
+}
+
+// Reads a number such as 12.5 and returns the long double nearest to it.
+// The digits are gathered into an integer mantissa, and the decimal places
+// into a power of ten to divide it by. If both are exact in a long double,
+// the one division is correctly rounded (Clinger's fast path). Otherwise,
+// strtold() converts the number.
+static long double get_decimal_literal(clc_context *ctx)
+{
+	const char *literal = ctx->expression - 1; // where look was read from
+	const char *p = literal;
+	uint64_t mantissa = 0;
+	bool mantissa_fits = true;
+	int decimalPointCount = 0;
+	int decimalPlaces = 0;
+
+	// Scanned here rather than with get_next_char(), which costs a store
+	// to the context for every digit.
+	for (; ('0' <= *p && *p <= '9') || *p == '.'; p++) {
+		if (*p == '.') {
 			if (++decimalPointCount > 1)
-				report_invalid_expression_and_abort();
-			_expression_contains_floats = true;
+				report_invalid_expression(ctx);
+			ctx->expression_contains_floats = true;
 		} else {
-			int digit = look - '0';
-			if (decimalPointCount == 1) {
-				acc += digit / decimalPointPowerOfTen;
-				decimalPointPowerOfTen *= 10.0;
-			} else 
-				acc = (acc * 10.0) + digit;
+			int digit = *p - '0';
+			if (mantissa < UINT64_MAX / 10 || (mantissa == UINT64_MAX / 10 && digit <= UINT64_MAX % 10)) {
+				mantissa = mantissa * 10 + digit;
+				if (decimalPointCount == 1)
+					++decimalPlaces;
+			} else
+				mantissa_fits = false;
 		}
+	}
+
+	ctx->expression = p;
+	get_next_char(ctx);
 
-		get_next_char();
+	if (mantissa_fits && mantissa_is_exact(mantissa) && decimalPlaces <= MAX_EXACT_POWER_OF_TEN) {
+		if (decimalPlaces == 0)
+			return (long double)mantissa;
+		return (long double)mantissa / powers_of_ten[decimalPlaces];
 	}
 
-	skip_white_space();
+	// The number is followed by a character strtold() could read on with,
+	// such as the e of 1e5, only if the expression is invalid anyway.
+	return strtold(literal, NULL);
+}
 
-	return unaryNegation ? -acc : acc;
+static bool mantissa_is_exact(uint64_t mantissa)
+{
+#if LDBL_MANT_DIG >= 64
+	return true;
+#else
+	return (mantissa >> LDBL_MANT_DIG) == 0;
+#endif
 }
 
-static void get_next_non_whitespace_char()
+static void get_next_non_whitespace_char(clc_context *ctx)
 {
-	get_next_char();
-	skip_white_space();
+	get_next_char(ctx);
+	skip_white_space(ctx);
 }
 
-static void get_next_char()
+static void get_next_char(clc_context *ctx)
 {
-	look = *_expression++;
+	ctx->look = *ctx->expression++;
 }
 
-static void skip_white_space()
+static void skip_white_space(clc_context *ctx)
 {
-	while (isspace(look))
-		get_next_char();
+	while (isspace(ctx->look))
+		get_next_char(ctx);
 }
 
-static void abort_if_expression_starts_with_two_unary_operators(char *expression)
+static void fail_if_expression_starts_with_two_unary_operators(clc_context *ctx, const char *expression)
 {
-	_expression = expression;
+	ctx->expression = expression;
 
-	get_next_non_whitespace_char();
-	if (look != '+' && look != '-')
+	get_next_non_whitespace_char(ctx);
+	if (ctx->look != '+' && ctx->look != '-')
 		return;
 
-	get_next_non_whitespace_char();
-	if (look == '\0')
+	get_next_non_whitespace_char(ctx);
+	if (ctx->look == '\0')
 		return;
 
-	if (look == '+' || look == '-')
-		report_invalid_expression_and_abort();
+	if (ctx->look == '+' || ctx->look == '-')
+		report_invalid_expression(ctx);
 }
 
-static void abort_if_not_end_of_expression()
+static void fail_if_not_end_of_expression(clc_context *ctx)
 {
-	if (look != '\0')
-		report_invalid_expression_and_abort();
+	if (ctx->look != '\0')
+		report_invalid_expression(ctx);
 }
 
-static void report_invalid_expression_and_abort()
+static void report_invalid_expression(clc_context *ctx)
 {
-	puts("clc: invalid elementary arithmetic expression\nTry 'clc --help' for more information.");
-	exit(EXIT_FAILURE);
+	ctx->error = CLC_INVALID_EXPRESSION;
+	longjmp(ctx->error_jmp_buf, 1);
 }
@@ -0,0 +1,294 @@
+#include <errno.h>
+#include <setjmp.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "libclc.h"
+
+static void format_answer(clc_context *ctx, evaluation_result result, char *buffer, int buf_size);
+static void fail_to_format_answer(clc_context *ctx, const char *message, const char *answer);
+static void replace_char(char *str, char orig, char new);
+static void snprintf_or_fail(clc_context *ctx, char *buffer, int buf_size, char *fmt, int precision, long double answer);
+static int get_mantissa(clc_context *ctx, char *buffer);
+static trailing_d_result get_number_of_trailing_d_followed_by_up_to_two_non_d(char *answer, char digit);
+static void remove_trailing_zeros_in_decimal_fraction(clc_context *ctx, char *buffer, int buf_size, bool keep_decimal_point);
+
+clc_context *clc_create_context(void)
+{
+	clc_context *ctx = malloc(sizeof(clc_context));
+	if (ctx != NULL)
+		ctx->error = CLC_OK;
+	return ctx;
+}
+
+void clc_destroy_context(clc_context *ctx)
+{
+	free(ctx);
+}
+
+clc_error clc_calculate(clc_context *ctx, const char *expression, char *output, int output_size)
+{
+	char normalized_expression[CLC_EXPRESSION_BUF_SIZE];
+	char answer[32];
+	evaluation_result result;
+	clc_error error;
+
+	if (strlen(expression) >= CLC_EXPRESSION_BUF_SIZE)
+		error = ctx->error = CLC_EXPRESSION_TOO_LONG;
+	else {
+		strcpy(normalized_expression, expression);
+		clc_normalize_expression(normalized_expression);
+		error = clc_evaluate(ctx, normalized_expression, &result);
+		if (error == CLC_OK)
+			error = clc_format_answer(ctx, result, answer, sizeof(answer)/sizeof(answer[0]));
+	}
+
+	int n = snprintf(output, output_size, "%s\n", error == CLC_OK ? answer : clc_error_message(ctx));
+	if (n < 0 || n >= output_size) {
+		ctx->error = CLC_OUTPUT_BUFFER_TOO_SMALL;
+		return ctx->error;
+	}
+	return error;
+}
+
+clc_error clc_calculate_many(clc_context *ctx, const char *const *expressions, int count, char *outputs, int output_size, clc_error *errors)
+{
+	clc_error first_error = CLC_OK;
+	int i;
+
+	for (i = 0; i < count; i++) {
+		errors[i] = clc_calculate(ctx, expressions[i], outputs + (size_t)i*output_size, output_size);
+		if (first_error == CLC_OK)
+			first_error = errors[i];
+	}
+
+	return first_error;
+}
+
+const char *clc_error_message(const clc_context *ctx)
+{
+	switch (ctx->error) {
+		case CLC_OK:
+			return "";
+		case CLC_INVALID_EXPRESSION:
+			return "clc: invalid elementary arithmetic expression\nTry 'clc --help' for more information.";
+		case CLC_EXPRESSION_TOO_LONG:
+			return "Expression buffer too small.";
+		case CLC_OUTPUT_BUFFER_TOO_SMALL:
+			return "Output buffer too small.";
+		default:
+			return ctx->error_message;
+	}
+}
+
+void clc_normalize_expression(char *expression)
+{
+	replace_char(expression, '[', '(');
+	replace_char(expression, ']', ')');
+	replace_char(expression, 'x', '*');
+	replace_char(expression, 'X', '*');
+}
+
+static void replace_char(char *str, char orig, char new)
+{
+	char *match = str;
+	while ((match = strchr(match, orig)) != NULL)
+		*match++ = new;
+}
+
+clc_error clc_format_answer(clc_context *ctx, evaluation_result result, char *buffer, int buf_size)
+{
+	char answer[32];
+
+	// An answer that cannot be formatted jumps back here.
+	if (setjmp(ctx->error_jmp_buf) != 0)
+		return ctx->error;
+
+	format_answer(ctx, result, answer, sizeof(answer)/sizeof(answer[0]));
+
+	char *p_answer = answer;
+	if (strcmp(answer, "-0") == 0)
+		++p_answer; // "0"
+	if (strcmp(answer, "-0.0") == 0)
+		++p_answer; // "0.0"
+
+	if (strlen(p_answer) >= buf_size) {
+		ctx->error = CLC_OUTPUT_BUFFER_TOO_SMALL;
+		return ctx->error;
+	}
+	strcpy(buffer, p_answer);
+
+	ctx->error = CLC_OK;
+	return CLC_OK;
+}
+
+static void format_answer(clc_context *ctx, evaluation_result result, char *buffer, int buf_size)
+{
+	long double answer = result.answer;
+
+	floating_point_type fp_type = clc_get_floating_point_type();
+	int num_decimal_places_e_form = clc_get_number_of_significant_digits_in_answer(fp_type, result.expression_contains_floats, result.expression_contains_multiplication_or_division)-1;
+
+	snprintf_or_fail(ctx, buffer, buf_size, (char *)"%.*Le", num_decimal_places_e_form, answer);
+
+	if ((strcmp(buffer, "inf") != 0 && strcmp(buffer, "-inf") != 0) &&
+		(strcmp(buffer, "nan") != 0 && strcmp(buffer, "-nan") != 0)) {
+		int mantissa = get_mantissa(ctx, buffer);
+		if (-3 <= mantissa && mantissa <= num_decimal_places_e_form) {
+			int num_decimal_places = num_decimal_places_e_form - mantissa;
+			if (num_decimal_places == 0)
+				num_decimal_places = (result.expression_contains_floats ? 1 : 0);
+			snprintf_or_fail(ctx, buffer, buf_size, (char *)"%.*Lf", num_decimal_places, answer);
+			trailing_d_result nines_result = get_number_of_trailing_d_followed_by_up_to_two_non_d(buffer, '9');
+			int number_of_nines = nines_result.d_count + nines_result.non_d_count;
+			if (8 <= number_of_nines && number_of_nines <= num_decimal_places) {
+				int num_decimals = num_decimal_places - number_of_nines;
+				if (num_decimals == 0)
+					num_decimals = (result.expression_contains_floats ? 1 : 0);
+				snprintf_or_fail(ctx, buffer, buf_size, (char *)"%.*Lf", num_decimals, answer);
+			}
+
+			trailing_d_result zeros_result = get_number_of_trailing_d_followed_by_up_to_two_non_d(buffer, '0');
+			int number_of_zeros = zeros_result.d_count + zeros_result.non_d_count;
+			// Don't truncate -9170.0000000000029 and -508.00000000000087.
+			if (zeros_result.non_d_count > 0 && 5 <= number_of_zeros && number_of_zeros <= num_decimal_places-1)
+				snprintf_or_fail(ctx, buffer, buf_size, (char *)"%.*Lf", num_decimal_places-number_of_zeros, answer);
+		}
+	}
+
+	remove_trailing_zeros_in_decimal_fraction(ctx, buffer, buf_size, result.expression_contains_floats);
+}
+
+static void fail_to_format_answer(clc_context *ctx, const char *message, const char *answer)
+{
+	snprintf(ctx->error_message, sizeof(ctx->error_message), "%s%s", message, answer);
+	ctx->error = CLC_ANSWER_FORMAT_ERROR;
+	longjmp(ctx->error_jmp_buf, 1);
+}
+
+floating_point_type clc_get_floating_point_type(void)
+{
+	if (sizeof(long double) > sizeof(double))
+		return LONG_DOUBLE;
+	else if (sizeof(long double) == sizeof(double))
+		return DOUBLE;
+	else if (sizeof(long double) == sizeof(float))
+		return FLOAT;
+
+	return UNKNOWN;
+}
+
+int clc_get_number_of_significant_digits_in_answer(floating_point_type fp_type, bool expression_contains_floats, bool expression_contains_multiplication_or_division)
+{
+	if (fp_type == LONG_DOUBLE) {
+		// Number of digits is empirically determined from generating many
+		// random expressions and comparing answers from this program
+		// to calc (https://github.com/lcn2/calc), an arbitrary precision calculator.
+		if (expression_contains_multiplication_or_division)
+			return expression_contains_floats ? 16 : 17;
+		else
+			return expression_contains_floats ? 18 : 19;
+	} else {
+		if (expression_contains_multiplication_or_division)
+			return expression_contains_floats ? 13 : 13;
+		else
+			return expression_contains_floats ? 13 : 15;
+	}
+}
+
+static void snprintf_or_fail(clc_context *ctx, char *buffer, int buf_size, char *fmt, int precision, long double answer)
+{
+	int n = snprintf(buffer, buf_size, fmt, precision, answer);
+	if (n >= buf_size)
+		fail_to_format_answer(ctx, "Answer buffer too small.", "");
+	if (n < 0)
+		fail_to_format_answer(ctx, "Internal format error.", "");
+}
+
+static int get_mantissa(clc_context *ctx, char *buffer)
+{
+	char *e = strchr(buffer, 'e');
+	if (e == NULL)
+		fail_to_format_answer(ctx, "Mantissa not found: ", buffer);
+	errno = 0;
+	long mantissa_l = strtol(e+1, NULL,  10);
+	int mantissa = (int)mantissa_l;
+	if (errno == ERANGE || mantissa != mantissa_l)
+		fail_to_format_answer(ctx, "Mantissa too big: ", buffer);
+	return mantissa;
+}
+
+static trailing_d_result get_number_of_trailing_d_followed_by_up_to_two_non_d(char *answer, char digit)
+{
+	trailing_d_result result = { .d_count = 0, .non_d_count = 0 };
+
+	char *p = strchr(answer, '.');
+	if (p == NULL)
+		return result;
+
+	p = answer + strlen(answer) - 1;
+
+	int non_digit_count = 0, i;
+	for (i = 0; i < 2; i++)
+		if ('0' <= *p && *p <= '9' && *p != digit) {
+			++non_digit_count;
+			--p;
+		}
+
+	int digit_count = 0;
+	while (answer <= p && *p == digit) {
+		++digit_count;
+		--p;
+	}
+
+	if (digit_count == 0)
+		non_digit_count = 0;
+
+	result.d_count = digit_count;
+	result.non_d_count = non_digit_count;
+
+	return result;
+}
+
+static void remove_trailing_zeros_in_decimal_fraction(clc_context *ctx, char *buffer, int buf_size, bool keep_decimal_point)
+{
+	char *p = strchr(buffer, '.');
+	if (p == NULL)
+		return;
+
+	unsigned long len = strlen(p);
+
+	char *e = strchr(buffer, 'e');
+	if (e != NULL) {
+		if (!(e > p))
+			return;
+		len = (e-p)/sizeof(char);
+	}
+
+	p += len;
+	unsigned long i;
+	for (i=0; i<len; i++, p--)
+		if (*(p-1) != '0' && *(p-1) != '.')
+			break;
+
+	if (keep_decimal_point && *p == '.') {
+		++p;
+		if (*p == '0')
+			++p;
+	}
+
+	if (e == NULL)
+		*p = '\0';
+	else {
+		char ebuffer[8];
+		const int ebuffer_len = sizeof(ebuffer)/sizeof(ebuffer[0]);
+		const unsigned long e_len = strlen(e);
+		const unsigned long p_buffer_len = strlen(p) + 1;
+		if (e_len >= ebuffer_len || e_len >= p_buffer_len)
+			fail_to_format_answer(ctx, "e buffer too small.", "");
+
+		strncpy(ebuffer, e, ebuffer_len);
+		strncpy(p, ebuffer, p_buffer_len);
+	}
+}
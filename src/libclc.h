@@ -0,0 +1,69 @@
+#ifndef LIBCLC_H_INCLUDED
+#define LIBCLC_H_INCLUDED
+
+#include <setjmp.h>
+#include <stdbool.h>
+
+#include "evaluation_result.h"
+
+#define CLC_EXPRESSION_BUF_SIZE (511+1)
+
+typedef enum {
+	LONG_DOUBLE,
+	DOUBLE,
+	FLOAT,
+	UNKNOWN
+} floating_point_type;
+
+typedef enum {
+	CLC_OK,
+	CLC_INVALID_EXPRESSION,
+	CLC_EXPRESSION_TOO_LONG,
+	CLC_ANSWER_FORMAT_ERROR,
+	CLC_OUTPUT_BUFFER_TOO_SMALL
+} clc_error;
+
+// State of one evaluation. Each thread evaluating at the same time needs a
+// context of its own.
+typedef struct clc_context clc_context;
+struct clc_context {
+	char look; // lookahead character
+	const char *expression; // next character after look
+	bool expression_contains_floats;
+	bool expression_contains_multiplication_or_division;
+	clc_error error;
+	char error_message[64];
+	jmp_buf error_jmp_buf;
+};
+
+clc_context *clc_create_context(void);
+void clc_destroy_context(clc_context *ctx);
+
+// Evaluates an expression of +, -, *, / and (). Brackets and x must have been
+// replaced with clc_normalize_expression().
+clc_error clc_evaluate(clc_context *ctx, const char *expression, evaluation_result *result);
+
+// Replaces [, ], x and X in the expression with (, ) and *.
+void clc_normalize_expression(char *expression);
+
+// Writes the answer as clc prints it, without the newline.
+clc_error clc_format_answer(clc_context *ctx, evaluation_result result, char *buffer, int buf_size);
+
+// Writes exactly what clc prints for the expression, newline included: the
+// answer, or the error message. Options such as -p are not recognized.
+clc_error clc_calculate(clc_context *ctx, const char *expression, char *output, int output_size);
+
+// Calls clc_calculate() for each of count expressions, in one call for
+// bindings that would otherwise cross into the library once per expression.
+// The output of expression i is written to outputs + i*output_size, and its
+// error to errors[i]. Returns CLC_OK, or the error of the first expression
+// that failed.
+clc_error clc_calculate_many(clc_context *ctx, const char *const *expressions, int count, char *outputs, int output_size, clc_error *errors);
+
+// The message clc prints for the last error of the context.
+const char *clc_error_message(const clc_context *ctx);
+
+floating_point_type clc_get_floating_point_type(void);
+int clc_get_number_of_significant_digits_in_answer(floating_point_type fp_type, bool expression_contains_floats, bool expression_contains_multiplication_or_division);
+
+#endif
@@ -5,6 +5,10 @@
 # invokes clc to test that it calculates the correct the answer for each
 # expression.
 #
+# Each file is evaluated with one job per processor. calc's answers are
+# cached in calc-answers.sqlite in the expression directory, so rerunning the
+# script after editing a few expressions makes few calc queries.
+#
 # If a directory containing the expression files is not specified in $1,
 # a default one is assigned:
 
@@ -13,6 +17,9 @@ _expression_dir=$1
 
 _script_dir="${0%/*}"
 
+_jobs=$(nproc 2>/dev/null)
+[ "$_jobs" != "" ] || _jobs=1
+
 rm "$_expression_dir/summary" 2> /dev/null
 
 echo -n "# " | tee -a "$_expression_dir/summary"
@@ -20,5 +27,5 @@ echo -n "# " | tee -a "$_expression_dir/summary"
 
 for f in "$_expression_dir"/*-expr; do
 	echo -n "$(basename $f): " | tee -a "$_expression_dir/summary"
-	"$_script_dir/create-test-cases-from-generated-expressions.py" "$f" | tee -a "$_expression_dir/summary"
+	"$_script_dir/create-test-cases-from-generated-expressions.py" --jobs $_jobs --cache "$_expression_dir/calc-answers.sqlite" "$f" | tee -a "$_expression_dir/summary"
 done
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+
+"""
+This Python script measures how fast generate-random-elementary-arithmetic-
+expressions.py generates expressions: expressions per second, attempts per
+expression generated and peak memory, for each operator profile and band of
+expression lengths.
+
+Results can be saved as a JSON baseline, and later runs compared against it
+to flag slowdowns.
+
+Syntax: ./benchmark-expression-generator.py [options]
+
+Type -h or --help to see program options.
+
+Exit code:
+0 = Benchmark run; no slowdown beyond the threshold.
+1 = Command line options displayed.
+2 = Invalid program option specified.
+3 = Slowdown beyond the threshold.
+"""
+
+import getopt
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+
+def load_generator_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'generate-random-elementary-arithmetic-expressions.py')
+    spec = importlib.util.spec_from_file_location('expression_generator',
+                                                  path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+gen = load_generator_module()
+
+default_bands = [(1, 32), (33, 128), (129, 511)]
+
+
+def main():
+    params = parse_cmd_line_options(sys.argv[1:])
+
+    results = run_benchmarks(params)
+
+    baseline = None
+    if params['compare_filename'] is not None:
+        baseline = read_results(params['compare_filename'])
+
+    slowdowns = print_results(results, baseline, params['threshold'])
+
+    if params['save_filename'] is not None:
+        write_results(params['save_filename'], params, results)
+
+    sys.exit(3 if slowdowns else 0)
+
+
+def run_benchmarks(params):
+    results = {}
+    for operators in params['operators']:
+        for band in params['bands']:
+            key = "%s %d-%d" % (operators, band[0], band[1])
+            eprint("Benchmarking", key)
+            results[key] = benchmark(operators, band, params)
+    return results
+
+
+def benchmark(operators, band, params):
+    """
+    Generates count expressions of each length of band, repeat times, and
+    returns the fastest run. Peak memory is measured in a separate run, as
+    tracing allocations slows generation down.
+    """
+    lengths = range(band[0], band[1] + 1)
+
+    setup_start = time.perf_counter()
+    profile = build_profile(operators, band, params)
+    setup_seconds = time.perf_counter() - setup_start
+
+    best_seconds = None
+    for i in range(params['repeat']):
+        profile.stats.reset()
+        start = time.perf_counter()
+        expr_count = sum(1 for expr in gen.iter_expressions(
+            profile, lengths, params['count'], params['seed']))
+        seconds = time.perf_counter() - start
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+    attempts_per_expression = profile.stats.attempts_per_expression()
+    failures = profile.stats.failures
+
+    tracemalloc.start()
+    for expr in gen.iter_expressions(profile, lengths, params['count'],
+                                     params['seed']):
+        pass
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'expressions': expr_count,
+        'failures': failures,
+        'setup_seconds': round(setup_seconds, 6),
+        'seconds': round(best_seconds, 6),
+        'expressions_per_second': round(expr_count / best_seconds, 1)
+            if best_seconds > 0 else None,
+        'attempts_per_expression': round(attempts_per_expression, 3)
+            if attempts_per_expression is not None else None,
+        'peak_memory_bytes': peak
+    }
+
+
+def build_profile(operators, band, params):
+    return gen.ExpressionGenerator(gen.operators_by_option[operators],
+                                   params['integer_len'], params['float_len'],
+                                   None, band[1], params['engine'])
+
+
+def print_results(results, baseline, threshold):
+    """
+    Prints the results, compared with the baseline if there is one, and
+    returns the keys of those slower than the baseline by more than
+    threshold percent.
+    """
+    slowdowns = []
+    print("{:<16}{:>12}{:>12}{:>12}{:>12}{:>10}".format(
+        "Profile", "Expr/s", "Attempts", "Peak KiB", "Setup s",
+        "Change" if baseline is not None else ""))
+    for key, result in results.items():
+        change = ""
+        if baseline is not None and key in baseline['results']:
+            change = compare(result, baseline['results'][key])
+            if change is not None:
+                if change < -threshold:
+                    slowdowns.append(key)
+                change = "{:+.1f}%".format(change)
+            else:
+                change = "n/a"
+        print("{:<16}{:>12}{:>12}{:>12.0f}{:>12.3f}{:>10}".format(
+            key,
+            format_optional(result['expressions_per_second'], "{:.1f}"),
+            format_optional(result['attempts_per_expression'], "{:.3f}"),
+            result['peak_memory_bytes'] / 1024,
+            result['setup_seconds'],
+            change))
+        if result['failures']:
+            print("  {} expressions could not be generated".format(
+                result['failures']))
+
+    if baseline is not None:
+        if slowdowns:
+            print("SLOWER than baseline by more than {}%: {}".format(
+                threshold, ", ".join(slowdowns)))
+        else:
+            print("No slowdown beyond {}%.".format(threshold))
+    return slowdowns
+
+
+def compare(result, baseline_result):
+    """
+    Returns the change in expressions per second from the baseline, in
+    percent, or None if either has none.
+    """
+    if not (result['expressions_per_second']
+            and baseline_result.get('expressions_per_second')):
+        return None
+    return (100.0 * result['expressions_per_second']
+            / baseline_result['expressions_per_second'] - 100.0)
+
+
+def format_optional(value, fmt):
+    return "n/a" if value is None else fmt.format(value)
+
+
+def read_results(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        eprint("Cannot read baseline {}: {}".format(filename, e))
+        sys.exit(2)
+
+
+def write_results(filename, params, results):
+    with open(filename, 'w') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'engine': params['engine'],
+            'integer_len': params['integer_len'],
+            'float_len': params['float_len'],
+            'count': params['count'],
+            'seed': params['seed'],
+            'results': results
+        }, f, indent=2)
+        f.write("\n")
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def show_help_and_exit():
+    print("Measures how fast expressions are generated for each operator")
+    print("profile and band of expression lengths.")
+    print()
+    print("Options:")
+    print("-o, --operators a,s,m,d,as,md,asmd")
+    print("  Operator profiles to benchmark. Default: all")
+    print("-b, --bands n-n,...")
+    print("  Bands of expression lengths. Default: 1-32,33-128,129-511")
+    print("-i, --integer nn")
+    print("-f, --float nn")
+    print("-e, --engine exact|retry")
+    print("  As for generate-random-elementary-arithmetic-expressions.py.")
+    print("  Default: random length integers and floats, exact engine.")
+    print("-c, --count n")
+    print("  Expressions generated for each length. Default: 1")
+    print("-r, --repeat n")
+    print("  Times each band is generated; the fastest counts. Default: 3")
+    print("--seed n")
+    print("  Seed of the expressions generated. Default: 0")
+    print("--save filename")
+    print("  Saves the results as a JSON baseline.")
+    print("--compare filename")
+    print("  Compares the results with a JSON baseline.")
+    print("-t, --threshold n")
+    print("  Percentage slowdown from the baseline that is flagged and makes")
+    print("  the exit code 3. Default: 10")
+    print("-h, --help")
+    print("  Displays this help screen.")
+    sys.exit(1)
+
+
+def show_invalid_syntax_and_exit():
+    eprint('Invalid syntax. Enter -h for help.')
+    sys.exit(2)
+
+
+def parse_bands(arg):
+    bands = []
+    for band in arg.split(','):
+        bounds = band.split('-')
+        if (len(bounds) != 2 or not bounds[0].isdigit()
+            or not bounds[1].isdigit()):
+            show_invalid_syntax_and_exit()
+        first, last = int(bounds[0]), int(bounds[1])
+        if not 1 <= first <= last:
+            show_invalid_syntax_and_exit()
+        bands.append((first, last))
+    return bands
+
+
+def parse_cmd_line_options(argv):
+    operators = list(gen.operators_by_option)
+    bands = default_bands
+    integer_len = None
+    float_len = None
+    engine = 'exact'
+    count = 1
+    repeat = 3
+    seed = 0
+    save_filename = None
+    compare_filename = None
+    threshold = 10.0
+
+    try:
+        opts, args = getopt.getopt(argv, "o:b:i:f:e:c:r:t:h",
+                                   ["operators=", "bands=", "integer=",
+                                    "float=", "engine=", "count=", "repeat=",
+                                    "seed=", "save=", "compare=",
+                                    "threshold=", "help"])
+    except getopt.GetoptError:
+        show_invalid_syntax_and_exit()
+    if args:
+        show_invalid_syntax_and_exit()
+    for opt, arg in opts:
+        if opt in ("-o", "--operators"):
+            operators = arg.split(',')
+            if not all(o in gen.operators_by_option for o in operators):
+                show_invalid_syntax_and_exit()
+        elif opt in ("-b", "--bands"):
+            bands = parse_bands(arg)
+        elif opt in ("-i", "--integer"):
+            if not arg.isdigit():
+                show_invalid_syntax_and_exit()
+            integer_len = int(arg)
+        elif opt in ("-f", "--float"):
+            if not arg.isdigit():
+                show_invalid_syntax_and_exit()
+            float_len = int(arg)
+        elif opt in ("-e", "--engine"):
+            if arg not in ('exact', 'retry'):
+                show_invalid_syntax_and_exit()
+            engine = arg
+        elif opt in ("-c", "--count"):
+            if not arg.isdigit() or int(arg) < 1:
+                show_invalid_syntax_and_exit()
+            count = int(arg)
+        elif opt in ("-r", "--repeat"):
+            if not arg.isdigit() or int(arg) < 1:
+                show_invalid_syntax_and_exit()
+            repeat = int(arg)
+        elif opt == "--seed":
+            if not arg.isdigit():
+                show_invalid_syntax_and_exit()
+            seed = int(arg)
+        elif opt == "--save":
+            save_filename = arg
+        elif opt == "--compare":
+            compare_filename = arg
+        elif opt in ("-t", "--threshold"):
+            try:
+                threshold = float(arg)
+            except ValueError:
+                show_invalid_syntax_and_exit()
+        elif opt in ("-h", "--help"):
+            show_help_and_exit()
+
+    return {
+        'operators': operators,
+        'bands': bands,
+        'integer_len': integer_len,
+        'float_len': float_len,
+        'engine': engine,
+        'count': count,
+        'repeat': repeat,
+        'seed': seed,
+        'save_filename': save_filename,
+        'compare_filename': compare_filename,
+        'threshold': threshold
+    }
+
+
+if __name__ == "__main__":
+    main()
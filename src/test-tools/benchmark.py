@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+"""
+This Python script times how long clc takes to run, one invocation at a
+time, as a shell runs it.
+
+It runs ./clc -p, which evaluates nothing, to time startup, then ./clc on
+expressions sampled from each category of test-cases.jsonl, the corpus of
+generated expression test cases. It reports the 50th and 99th percentile
+latencies and the throughput (invocations a second) of startup and of
+evaluation, and the evaluation latencies by expression length and by
+category, the run_<category>_tests functions of the tests-*.sh scripts.
+
+The results can be saved as a baseline and a later run compared with it,
+to check changes to clc.c, evaluator.c or the OPTS of the makefile.
+
+Run from the directory of clc, as the test scripts are.
+
+Syntax: ./test-tools/benchmark.py [-n n] [-s n] [--startup n]
+                                  [--save-baseline filename]
+                                  [--baseline filename [--threshold pct]]
+
+Type -h or --help to see program options.
+
+Exit code:
+0 = Benchmark run.
+1 = Command line options displayed.
+2 = Invalid program option specified.
+3 = Slower than the baseline by more than the threshold.
+"""
+
+import getopt
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def load_module(name, filename):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+corpus = load_module('test_corpus', 'test-corpus.py')
+
+clc = './clc'
+
+# Upper bounds of the expression length ranges reported.
+length_ranges = [16, 64, 128, 256, 512]
+
+
+def main():
+    params = parse_cmd_line_options(sys.argv[1:])
+
+    startup = time_invocations([['-p']] * params['startup'], params['repeat'])
+    samples = sample_expressions(params['sample'])
+    latencies = time_invocations([[expression]
+                                  for category, expression in samples],
+                                 params['repeat'])
+
+    results = {
+        'startup': summarize(startup),
+        'evaluation': summarize(latencies),
+        'by_length': {},
+        'by_category': {}
+    }
+    for low, high in zip([1] + length_ranges, length_ranges):
+        selected = [latency
+                    for (category, expression), latency
+                    in zip(samples, latencies)
+                    if low <= len(expression) < high]
+        if selected:
+            results['by_length']['%d-%d' % (low, high-1)] = \
+                summarize(selected)
+    for category in dict.fromkeys(category for category, expression
+                                  in samples):
+        results['by_category'][category] = summarize(
+            [latency for (sample_category, expression), latency
+             in zip(samples, latencies) if sample_category == category])
+
+    baseline = None
+    if params['baseline_filename'] is not None:
+        with open(params['baseline_filename'], 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    print_results(results, baseline)
+
+    if params['save_baseline_filename'] is not None:
+        with open(params['save_baseline_filename'], 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=1)
+
+    if baseline is not None:
+        slower = [name for name in ('startup', 'evaluation')
+                  if change(results[name]['p50'], baseline[name]['p50'])
+                  > params['threshold']]
+        if slower:
+            print("Slower than the baseline:", ", ".join(slower))
+            sys.exit(3)
+
+    sys.exit(0)
+
+
+def sample_expressions(sample_size):
+    """
+    Returns (category, expression) for up to sample_size expressions of each
+    category of the corpus, spread evenly over the category.
+    """
+    corpus_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '..', corpus.corpus_filename)
+    samples = []
+    for category, offsets in corpus.get_category_index(corpus_path).items():
+        expressions = [record['expression']
+                       for record in corpus.read_corpus(corpus_path,
+                                                        *offsets)]
+        step = max(len(expressions) / sample_size, 1)
+        samples += [(category, expressions[int(i * step)])
+                    for i in range(min(sample_size, len(expressions)))]
+    return samples
+
+
+def time_invocations(arg_lists, repeat):
+    """
+    Runs clc with each list of arguments, repeat times, one invocation at a
+    time, and returns the fastest time of each list, in seconds.
+    """
+    latencies = []
+    for args in arg_lists:
+        fastest = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([clc] + args, stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL)
+            elapsed = time.perf_counter() - start
+            if fastest is None or elapsed < fastest:
+                fastest = elapsed
+        latencies.append(fastest)
+    return latencies
+
+
+def percentile(values, pct):
+    """
+    Returns the pct percentile of values, by the nearest-rank method.
+    """
+    ordered = sorted(values)
+    rank = max(int(-(-pct * len(ordered) // 100)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies):
+    return {
+        'count': len(latencies),
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'throughput': len(latencies) / sum(latencies)
+    }
+
+
+def change(value, baseline_value):
+    """
+    Returns how much bigger value is than baseline_value, in percent.
+    """
+    return (value - baseline_value) * 100 / baseline_value
+
+
+def print_results(results, baseline):
+    width = max(len(name) for name in results['by_category'])
+    print("%-*s %6s %9s %9s %9s" % (width, "", "count", "p50 ms", "p99 ms",
+                                    "runs/s"))
+    print_summary(width, "startup (clc -p)", results['startup'],
+                  baseline and baseline.get('startup'))
+    print_summary(width, "evaluation", results['evaluation'],
+                  baseline and baseline.get('evaluation'))
+    for group, title in (('by_length', "By expression length:"),
+                         ('by_category', "By category:")):
+        print()
+        print(title)
+        for name, summary in results[group].items():
+            print_summary(width, name, summary,
+                          baseline and baseline[group].get(name))
+
+
+def print_summary(width, name, summary, baseline_summary):
+    line = "%-*s %6d %9.3f %9.3f %9.0f" % (
+        width, name, summary['count'], summary['p50'] * 1000,
+        summary['p99'] * 1000, summary['throughput'])
+    if baseline_summary:
+        line += "  p50 %+.1f%% p99 %+.1f%%" % (
+            change(summary['p50'], baseline_summary['p50']),
+            change(summary['p99'], baseline_summary['p99']))
+    print(line)
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def show_help_and_exit():
+    print("Times clc invocations: startup, and evaluation of expressions of")
+    print("the test corpus.")
+    print()
+    print("Options:")
+    print("-n, --repeat n")
+    print("  Runs each invocation n times and keeps the fastest. Default: 3")
+    print("-s, --sample n")
+    print("  Number of expressions timed from each category. Default: 50")
+    print("--startup n")
+    print("  Number of clc -p invocations timed for startup. Default: 200")
+    print("--save-baseline filename")
+    print("  Saves the results as a baseline, in JSON.")
+    print("--baseline filename")
+    print("  Compares the results with a baseline saved before.")
+    print("--threshold pct")
+    print("  Exits with code 3 if the p50 latency of startup or evaluation")
+    print("  is more than pct percent above the baseline's. Default: 10")
+    print("-h, --help")
+    print("  Displays this help screen.")
+    sys.exit(1)
+
+
+def show_invalid_syntax_and_exit():
+    eprint('Invalid syntax. Enter -h for help.')
+    sys.exit(2)
+
+
+def parse_cmd_line_options(argv):
+    repeat = 3
+    sample = 50
+    startup = 200
+    save_baseline_filename = None
+    baseline_filename = None
+    threshold = 10
+
+    try:
+        opts, args = getopt.getopt(argv, "n:s:h",
+                                   ["repeat=", "sample=", "startup=",
+                                    "save-baseline=",
+                                    "baseline=", "threshold=", "help"])
+    except getopt.GetoptError:
+        show_invalid_syntax_and_exit()
+    for opt, arg in opts:
+        if opt in ("-n", "--repeat"):
+            if not arg.isdigit() or int(arg) < 1:
+                show_invalid_syntax_and_exit()
+            repeat = int(arg)
+        elif opt in ("-s", "--sample"):
+            if not arg.isdigit() or int(arg) < 1:
+                show_invalid_syntax_and_exit()
+            sample = int(arg)
+        elif opt == "--startup":
+            if not arg.isdigit() or int(arg) < 1:
+                show_invalid_syntax_and_exit()
+            startup = int(arg)
+        elif opt == "--save-baseline":
+            save_baseline_filename = arg
+        elif opt == "--baseline":
+            if not os.path.isfile(arg):
+                show_invalid_syntax_and_exit()
+            baseline_filename = arg
+        elif opt == "--threshold":
+            if not arg.isdigit():
+                show_invalid_syntax_and_exit()
+            threshold = int(arg)
+        elif opt in ("-h", "--help"):
+            show_help_and_exit()
+    if args:
+        show_invalid_syntax_and_exit()
+
+    return {
+        'repeat': repeat,
+        'sample': sample,
+        'startup': startup,
+        'save_baseline_filename': save_baseline_filename,
+        'baseline_filename': baseline_filename,
+        'threshold': threshold
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""
+This Python script stands in for calc, the C-style arbitrary precision
+calculator, for trying out create-test-cases-from-generated-expressions.py
+where calc is not installed:
+
+CALC=./calc-stand-in.py ./create-test-cases-from-generated-expressions.py \
+    expressions_filename
+
+It reads statements from stdin, one per line, and prints their results the
+way calc does in pipe mode. It only knows what the test tools ask calc:
+- elementary math expressions, displayed to 20 decimal places, with a ~
+  in front when rounded;
+- printf("%e", expr), with a ~ in front when rounded, printf("%.nf", expr)
+  and printf("%.ne", expr);
+- print "text" and print version().
+Expressions are evaluated exactly with fractions, by exact_oracle.py.
+A division by zero whose quotient is the answer gives Error 10001, and 0/0
+Error 10002.
+
+This is a stand-in, not an oracle: its answers are not meant to match calc
+digit for digit.
+
+Syntax: ./calc-stand-in.py [-p] [-u]
+
+A line reading "crash" makes it exit with code 3, to try out restarts.
+"""
+
+import re
+import sys
+
+from exact_oracle import (CalcError, Evaluator, display, display_digits,
+                          format_exponential, format_fixed, is_approximation)
+
+
+version = 'calc-stand-in'
+
+
+def run_statement(statement):
+    """
+    Returns what calc prints for statement.
+    """
+    match = re.match(r'^print\s+"(.*)"\s*$', statement)
+    if match is not None:
+        return match.group(1) + '\n'
+
+    if re.match(r'^print\s+version\(\)\s*$', statement) is not None:
+        return version + '\n'
+
+    match = re.match(r'^printf\("%(\.(\d+))?([ef])",\s*(.*)\)\s*$',
+                     statement)
+    if match is not None:
+        value = Evaluator(match.group(4)).evaluate()
+        if match.group(3) == 'f':
+            return format_fixed(value, int(match.group(2) or display_digits))
+        if match.group(2) is None:
+            text = format_exponential(value, display_digits, True)
+            if is_approximation(text, value):
+                return '~' + text
+            return text
+        return format_exponential(value, int(match.group(2)))
+
+    return '\t' + display(Evaluator(statement).evaluate()) + '\n'
+
+
+def main():
+    for statement in sys.stdin:
+        statement = statement.strip()
+        if statement == 'crash':
+            sys.exit(3)
+        try:
+            output = run_statement(statement)
+        except CalcError as e:
+            output = '\tError %d\n' % e.code
+        except SyntaxError:
+            output = ''
+            print("Syntax error: " + statement, file=sys.stderr)
+        sys.stdout.write(output)
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
@@ -7,29 +7,268 @@ generates a sh-compatible script function to call clc to test that clc
 produces the correct answers.
 
 Syntax: ./create-test-cases-from-generated-expressions.py \
-        [-v, --verbose] expressions_filename
+        [-v, --verbose] [-j, --jobs n] [--oracle calc|exact] \
+        [--cache filename [--cache-size n]] [--resume] expressions_filename
+
+The expressions are read and their test cases written a chunk at a time, so
+memory use does not grow with the size of the expressions file. After each
+chunk, the number of expressions done is checkpointed in the .tests.checkpoint
+file next to the .tests file. --resume carries on from the checkpoint of a run
+that did not finish, if there is one.
+
+With --oracle exact, the expected answers are worked out in-process by
+exact_oracle.py, with fractions, instead of by calc. Each expression is
+evaluated once, and both its full answer key and the key in clc's precision
+are rounded from the same fraction.
+
+With --jobs, n expressions are evaluated by calc at a time, each job with its
+own calc process. The test cases are written in the order of the expressions
+all the same.
+
+With --cache, calc's answers are kept in an sqlite database, by query and
+calc version, and reused in later runs. When the cache holds more than
+--cache-size answers (default: 1000000), the least recently used ones are
+dropped.
 
 Dependencies:
 calc - C-style arbitrary precision calculator (https://github.com/lcn2/calc);
     used to generate the expected answers. Version version 2.12.6.7 used.
+    One calc process per job answers all the queries. The command line
+    running it can be set in the CALC environment variable. Default:
+    calc -p -u, -u because calc buffers its output to a pipe without it.
+    CALC=./calc-stand-in.py stands in for calc where it is not installed.
+libclc.so - clc's evaluator as a shared library, built by make lib; if the
+    CLC_LIBRARY environment variable names it, clc's answers are worked out
+    in-process by libclc.py instead of by running clc -b.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import getopt
+import io
+import json
 import re
 import os
+import shlex
+import sqlite3
 import subprocess
 import sys
+import threading
+
+import exact_oracle
+import libclc
+
+
+class CalcSession():
+    """
+    Sends queries to one calc process through a pipe instead of starting
+    calc for each of them.
+
+    Each query is followed by a print of a sentinel, and calc's response is
+    everything it writes before the sentinel. calc must not buffer its
+    output, or the sentinel is never read: hence calc -u. If calc dies, it
+    is restarted and the query is sent again, once.
+
+    The response is returned as calc writes it, with the tab in front of
+    answers and the ~ in front of rounded ones, printf's included; run_calc
+    strips them.
+    """
+
+    sentinel = '@@end-of-calc-response@@'
+
+    def __init__(self, command=None):
+        super(CalcSession, self).__init__()
+        if command is None:
+            command = shlex.split(os.environ.get('CALC', 'calc -p -u'))
+        self._command = command
+        self._process = None
+        self.queries = 0
+        self.restarts = 0
+
+    def query(self, expression):
+        """
+        Returns what calc writes to stdout for expression.
+        """
+        self.queries += 1
+        try:
+            return self._query(expression)
+        except (OSError, EOFError):
+            self.close()
+            self.restarts += 1
+            try:
+                return self._query(expression)
+            except (OSError, EOFError):
+                self.close()
+                raise RuntimeError("calc died answering %r" % expression)
+
+    def _query(self, expression):
+        if self._process is None:
+            self._process = subprocess.Popen(
+                self._command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                universal_newlines=True, bufsize=1)
+
+        self._process.stdin.write(expression + '\n')
+        self._process.stdin.write('print "' + self.sentinel + '"\n')
+        self._process.stdin.flush()
+
+        response = []
+        while True:
+            line = self._process.stdout.readline()
+            if line == '':
+                raise EOFError("calc exited with %r" % self._process.poll())
+            end = line.find(self.sentinel)
+            if end != -1:
+                response.append(line[:end])
+                return ''.join(response)
+            response.append(line)
+
+    def close(self):
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._process.wait(5)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+        self._process.stdout.close()
+        self._process = None
+
+
+class CalcSessions():
+    """
+    Gives each thread its own CalcSession, so that calc can answer the
+    queries of several threads at once.
+    """
+
+    def __init__(self):
+        super(CalcSessions, self).__init__()
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def query(self, expression):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = CalcSession()
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session.query(expression)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+
+
+calc_session = CalcSessions()
+
+
+class AnswerCache():
+    """
+    Keeps calc's answers in an sqlite database, keyed by the calc query with
+    its spaces removed and the calc version.
+
+    Each answer records when it was last used, counted in queries, and the
+    least recently used answers beyond max_size are dropped on closing.
+    """
+
+    default_max_size = 1000000
+
+    def __init__(self, filename, calc_version, max_size=default_max_size):
+        super(AnswerCache, self).__init__()
+        self._calc_version = calc_version
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "query TEXT NOT NULL, calc_version TEXT NOT NULL, "
+            "answer TEXT NOT NULL, approximated INTEGER NOT NULL, "
+            "last_used INTEGER NOT NULL, "
+            "PRIMARY KEY (query, calc_version))")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS answers_last_used "
+            "ON answers (last_used)")
+        self._clock = self._db.execute(
+            "SELECT COALESCE(MAX(last_used), 0) FROM answers").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query):
+        return re.sub(r'\s+', '', query)
+
+    def get(self, query):
+        """
+        Returns the (answer, approximated) cached for query, or None.
+        """
+        key = (self.normalize(query), self._calc_version)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT answer, approximated FROM answers "
+                "WHERE query = ? AND calc_version = ?", key).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._clock += 1
+            self._db.execute(
+                "UPDATE answers SET last_used = ? "
+                "WHERE query = ? AND calc_version = ?", (self._clock,) + key)
+        return row[0], bool(row[1])
+
+    def put(self, query, answer, approximated):
+        with self._lock:
+            self._clock += 1
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                (self.normalize(query), self._calc_version, answer,
+                 int(approximated), self._clock))
+
+    def close(self):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM answers WHERE rowid IN ("
+                "SELECT rowid FROM answers ORDER BY last_used DESC "
+                "LIMIT -1 OFFSET ?)", (self._max_size,))
+            self._db.commit()
+            self._db.close()
+
+
+answer_cache = None
+
+
+def get_calc_version():
+    return calc_session.query('print version()').strip()
 
 
 def main():
-    expr_filename, verbose = get_expr_filename_from_command_line()
-    expressions = read_in_all_expressions(expr_filename)
+    global answer_cache
+
+    expr_filename, verbose, jobs, oracle, cache_filename, cache_size, \
+        resume = get_expr_filename_from_command_line()
 
     output_filename = expr_filename + '.tests'
-    tossed_out_count = generate_script_function(
-        output_filename, expressions, verbose
-    )
+    try:
+        # The exact oracle asks calc nothing, so there is nothing to cache.
+        if cache_filename is not None and oracle == 'calc':
+            answer_cache = AnswerCache(cache_filename, get_calc_version(),
+                                       cache_size)
+        total_expr_count, tossed_out_count = generate_script_function(
+            output_filename, expr_filename, verbose, jobs, oracle, resume
+        )
+    finally:
+        if answer_cache is not None:
+            answer_cache.close()
+            print("Answer cache:", answer_cache.hits, "hits,",
+                  answer_cache.misses, "misses", file=sys.stderr)
+        calc_session.close()
 
-    total_expr_count = len(expressions)
     test_expr_count = total_expr_count - tossed_out_count
     print(test_expr_count, "test expressions",
             "+", tossed_out_count, "expressions commented out",
@@ -38,66 +277,200 @@ def main():
 
 def get_expr_filename_from_command_line():
     expr_filename = None
-    if len(sys.argv) == 2 or len(sys.argv) == 3:
-        verbose = sys.argv[1] == '-v' or sys.argv[1] == '--verbose'
-        if verbose:
-            if len(sys.argv) == 3:
-                expr_filename = sys.argv[2]
-        else:
-            expr_filename = sys.argv[1]
+    verbose = False
+    jobs = 1
+    oracle = 'calc'
+    cache_filename = None
+    cache_size = AnswerCache.default_max_size
+    resume = False
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "vj:",
+                                   ["verbose", "jobs=", "oracle=", "cache=",
+                                    "cache-size=", "resume"])
+    except getopt.GetoptError:
+        opts, args = [], []
+    for opt, arg in opts:
+        if opt in ("-v", "--verbose"):
+            verbose = True
+        elif opt in ("-j", "--jobs"):
+            if not arg.isdigit() or int(arg) < 1:
+                args = []
+                break
+            jobs = int(arg)
+        elif opt == "--oracle":
+            if arg not in ('calc', 'exact'):
+                args = []
+                break
+            oracle = arg
+        elif opt == "--cache":
+            cache_filename = arg
+        elif opt == "--cache-size":
+            if not arg.isdigit():
+                args = []
+                break
+            cache_size = int(arg)
+        elif opt == "--resume":
+            resume = True
+    if len(args) == 1:
+        expr_filename = args[0]
 
     if expr_filename == None:
         script_name = os.path.basename(__file__)
         print("Missing name of file containing elementary math expressions.")
-        print("Syntax:", script_name, "[-v, --verbose] expressions_filename")
+        print("Syntax:", script_name,
+              "[-v, --verbose] [-j, --jobs n] [--oracle calc|exact]",
+              "[--cache filename [--cache-size n]] [--resume]",
+              "expressions_filename")
         sys.exit(1)
 
-    return expr_filename, verbose
+    return expr_filename, verbose, jobs, oracle, cache_filename, cache_size, \
+        resume
 
 
-def read_in_all_expressions(expr_filename):
+expressions_per_chunk = 1000
+
+
+def read_expressions_in_chunks(expr_filename, skip_count=0):
+    """
+    Yields the expressions of the file, after the first skip_count, in lists
+    of up to expressions_per_chunk.
+    """
     with open(expr_filename, 'r') as expr_file:
-        expressions = expr_file.read().splitlines()
-    return expressions
+        expressions = (line.rstrip('\n') for line in expr_file)
+        for expr in islice(expressions, skip_count):
+            pass
+        while True:
+            chunk = list(islice(expressions, expressions_per_chunk))
+            if not chunk:
+                return
+            yield chunk
 
 
-def generate_script_function(output_filename, expressions, verbose):
-    commented_out_expr_count = 0
+def read_checkpoint(checkpoint_filename):
+    try:
+        with open(checkpoint_filename) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_checkpoint(checkpoint_filename, checkpoint):
+    temp_filename = checkpoint_filename + '.tmp'
+    with open(temp_filename, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temp_filename, checkpoint_filename)
+
+
+def generate_script_function(output_filename, expr_filename, verbose, jobs=1,
+                             oracle='calc', resume=False):
+    """
+    Writes the test function of the expressions in expr_filename, a chunk at
+    a time, and returns the number of expressions and how many of them are
+    commented out.
+    """
+    checkpoint_filename = output_filename + '.checkpoint'
+    checkpoint = read_checkpoint(checkpoint_filename) if resume else None
+    if checkpoint is None:
+        checkpoint = {'expressions': 0, 'commented_out': 0, 'offset': 0}
 
     basename = os.path.splitext(os.path.basename(output_filename))[0]
 
-    with open(output_filename, 'w') as script_file:
-        function_name = generate_function_name(basename)
-        script_file.write(function_name + "()\n")
-        script_file.write("{\n")
-
-        for idx, expr in enumerate(expressions):
-            clc_answer, exit_code = evaluate_expression_using_clc(expr)
-            full_answer_key, answer_key, approximated = \
-                evaluate_expression_using_calc(expr, clc_answer)
-
-            last_expression = idx+1 == len(expressions)
-
-            if clc_answer == answer_key:
-                if clc_answer == full_answer_key:
-                    write_out_expr_test_case(
-                        script_file, expr, answer_key, approximated,
-                        exit_code, verbose
-                    )
-                else:
-                    write_out_expr_test_case_rounded_key(
-                        script_file, expr, full_answer_key, approximated,
-                        answer_key, exit_code, verbose, not last_expression
-                    )
+    executor = ThreadPoolExecutor(jobs) if jobs > 1 else None
+
+    with open(output_filename, 'r+' if checkpoint['offset'] else 'w') \
+            as script_file:
+        script_file.seek(checkpoint['offset'])
+        script_file.truncate()
+
+        if checkpoint['offset'] == 0:
+            function_name = generate_function_name(basename)
+            script_file.write(function_name + "()\n")
+            script_file.write("{\n")
+
+        chunks = read_expressions_in_chunks(expr_filename,
+                                            checkpoint['expressions'])
+        expressions = next(chunks, [])
+        while expressions:
+            next_expressions = next(chunks, [])
+
+            answers = evaluate_expressions(expressions, oracle, executor)
+
+            script_chunk = io.StringIO()
+            checkpoint['commented_out'] += write_out_test_cases(
+                script_chunk, expressions, answers, verbose,
+                not next_expressions
+            )
+            script_file.write(script_chunk.getvalue())
+            script_file.flush()
+
+            checkpoint['expressions'] += len(expressions)
+            checkpoint['offset'] = script_file.tell()
+            write_checkpoint(checkpoint_filename, checkpoint)
+
+            expressions = next_expressions
+
+        script_file.write("}\n")
+
+    if executor is not None:
+        executor.shutdown()
+
+    if os.path.exists(checkpoint_filename):
+        os.remove(checkpoint_filename)
+
+    return checkpoint['expressions'], checkpoint['commented_out']
+
+
+def evaluate_expressions(expressions, oracle, executor=None):
+    """
+    Returns an iterator over the (clc answer, exit code, full answer key,
+    answer key, approximated) of each expression, worked out by the oracle,
+    calc or exact. The answers come back in the order of the expressions,
+    however many jobs of the executor, if any, evaluate them.
+    """
+    if oracle == 'exact':
+        evaluate_expression_using_oracle = evaluate_expression_exactly
+    else:
+        evaluate_expression_using_oracle = evaluate_expression_using_calc
+
+    def evaluate(expr_and_clc_answer):
+        expr, (clc_answer, exit_code) = expr_and_clc_answer
+        return (clc_answer, exit_code) + evaluate_expression_using_oracle(
+            expr, clc_answer)
+
+    clc_answers = evaluate_expressions_using_clc(expressions)
+    return (executor.map if executor is not None else map)(
+        evaluate, zip(expressions, clc_answers))
+
+
+def write_out_test_cases(script_file, expressions, answers, verbose,
+                         last_chunk):
+    commented_out_expr_count = 0
+
+    for idx, expr in enumerate(expressions):
+        clc_answer, exit_code, full_answer_key, answer_key, approximated = \
+            next(answers)
+
+        last_expression = last_chunk and idx+1 == len(expressions)
+
+        if clc_answer == answer_key:
+            if clc_answer == full_answer_key:
+                write_out_expr_test_case(
+                    script_file, expr, answer_key, approximated,
+                    exit_code, verbose
+                )
             else:
-                comment_out_expr_test_case(
+                write_out_expr_test_case_rounded_key(
                     script_file, expr, full_answer_key, approximated,
-                    answer_key, clc_answer, exit_code, verbose,
-                    not last_expression
+                    answer_key, exit_code, verbose, not last_expression
                 )
-                commented_out_expr_count += 1
-
-        script_file.write("}\n")
+        else:
+            comment_out_expr_test_case(
+                script_file, expr, full_answer_key, approximated,
+                answer_key, clc_answer, exit_code, verbose,
+                not last_expression
+            )
+            commented_out_expr_count += 1
 
     return commented_out_expr_count
 
@@ -143,18 +516,38 @@ def generate_function_name(filename):
     return function_name
 
 
-def evaluate_expression_using_clc(expr):
+def evaluate_expressions_using_clc(expressions):
+    """
+    Evaluates all the expressions with one clc process in batch mode, which
+    answers one line per expression, and returns their (answer, exit code).
+    With CLC_LIBRARY set, libclc.so answers them in-process instead.
+    """
+    library_filename = os.environ.get('CLC_LIBRARY')
+    if library_filename is not None:
+        with libclc.Clc(library_filename) as clc:
+            outputs = clc.calculate_many(expressions)
+        for expr, (output, exit_code) in zip(expressions, outputs):
+            assert is_float(output) and exit_code == 0, \
+                "Unexpected clc answer: %r. Expression: %r" % (output, expr)
+        return [(output.rstrip('\n'), 0) for output, exit_code in outputs]
+
     script_path = os.path.dirname(os.path.realpath(__file__))
     clc_full_path = script_path + '/../clc'
-    result = subprocess.run([clc_full_path, expr], stdout=subprocess.PIPE)
-    answer = re.sub('\n$', '', result.stdout.decode('utf-8'))
-    exit_code = result.returncode
-    # is_float() handles +/-inf and +/-nan
-    assert is_float(answer), \
-        "Unexpected clc answer: %r. Expression: %r" % (answer, expr)
-    assert exit_code == 0, \
-        "Exit code is %r, not 0. Expression: %r" % (exit_code, expr)
-    return answer, exit_code
+    result = subprocess.run([clc_full_path, '-b'], stdout=subprocess.PIPE,
+                            input=''.join(expr + '\n' for expr in expressions),
+                            universal_newlines=True)
+    answers = result.stdout.splitlines()
+    assert len(answers) == len(expressions), \
+        "clc answered %r lines for %r expressions" % (len(answers),
+                                                      len(expressions))
+    for expr, answer in zip(expressions, answers):
+        # is_float() handles +/-inf and +/-nan
+        assert is_float(answer), \
+            "Unexpected clc answer: %r. Expression: %r" % (answer, expr)
+    assert result.returncode == 0, \
+        "Exit code is %r, not 0." % result.returncode
+    # A valid expression exits clc with 0 when evaluated on its own.
+    return [(answer, 0) for answer in answers]
 
 
 def is_float(string):
@@ -177,28 +570,80 @@ def evaluate_expression_using_calc(expr, clc_answer):
             expr, has_float
         )
 
-    if full_answer_key == "Error 10001":
-        full_answer_key += ": divide by zero"
+    error_answer_keys = get_answer_keys_of_error(full_answer_key, clc_answer)
+    if error_answer_keys is not None:
+        full_answer_key, answer_key = error_answer_keys
+    else:
+        if full_answer_key == clc_answer:
+            answer_key = full_answer_key
+        else:
+            answer_key = get_answer_key_in_same_precision_as_clc_answer(
+                expr, clc_answer
+            )
+
+    return full_answer_key, answer_key, approximated
+
+
+def evaluate_expression_exactly(expr, clc_answer):
+    has_float = '.' in expr
+    try:
+        value = exact_oracle.evaluate(expr)
+    except exact_oracle.CalcError as e:
+        full_answer_key, answer_key = get_answer_keys_of_error(
+            "Error %d" % e.code, clc_answer
+        )
+        return full_answer_key, answer_key, False
+
+    exponential_form = 'e' in clc_answer
+    if exponential_form:
+        e_answer = exact_oracle.format_exponential(
+            value, exact_oracle.display_digits, True
+        )
+        approximated = exact_oracle.is_approximation(e_answer, value)
+        full_answer_key = normalize_exponential_answer(e_answer, has_float)
+    else:
+        answer = exact_oracle.display(value)
+        approximated = (answer[0] == '~')
+        if approximated:
+            answer = answer[1:]
+        full_answer_key = normalize_real_answer(answer, has_float)
+
+    if full_answer_key == clc_answer:
+        answer_key = full_answer_key
+    else:
+        precision = get_precision_in_clc_answer(clc_answer)
+        if exponential_form:
+            answer_key = normalize_exponential_answer(
+                exact_oracle.format_exponential(value, precision), has_float
+            )
+        else:
+            answer_key = exact_oracle.format_fixed(value, precision)
+
+    return full_answer_key, answer_key, approximated
+
+
+def get_answer_keys_of_error(error, clc_answer):
+    """
+    Returns the full answer key and answer key of a calc error, or None if
+    error is not one.
+    """
+    if error == "Error 10001":
+        full_answer_key = error + ": divide by zero"
         if clc_answer == 'inf' or clc_answer == '-inf' \
             or clc_answer == 'nan' or clc_answer == '-nan':
             answer_key = clc_answer
         else:
             answer_key = "divide0"
-    elif full_answer_key == "Error 10002":
-        full_answer_key += ": indeterminate (0/0)"
+    elif error == "Error 10002":
+        full_answer_key = error + ": indeterminate (0/0)"
         if clc_answer == 'nan' or clc_answer == '-nan':
             answer_key = clc_answer
         else:
             answer_key = "indeter"
     else:
-        if full_answer_key == clc_answer:
-            answer_key = full_answer_key
-        else:
-            answer_key = get_answer_key_in_same_precision_as_clc_answer(
-                expr, clc_answer
-            )
+        return None
 
-    return full_answer_key, answer_key, approximated
+    return full_answer_key, answer_key
 
 
 def get_answer_key_in_same_precision_as_clc_answer(expr, clc_answer):
@@ -235,7 +680,14 @@ def get_answer_key_in_exponential_form(expression, num_decimal_places):
 
 def get_answer_in_exponential_form(expression, always_include_decimal_point):
     e_answer, approximated = run_calc(expression)
+    return normalize_exponential_answer(e_answer, always_include_decimal_point), \
+        approximated
 
+
+def normalize_exponential_answer(e_answer, always_include_decimal_point):
+    """
+    Writes the exponent of e_answer, as calc prints it, the way clc does.
+    """
     if e_answer == "0":
         e_answer = "0e+00"
     elif e_answer.find('e') == -1:
@@ -250,25 +702,38 @@ def get_answer_in_exponential_form(expression, always_include_decimal_point):
         e_answer = parsed_e_re_result.group(1) + ".0" \
             + parsed_e_re_result.group(2)
 
-    return e_answer, approximated
+    return e_answer
 
 
 def get_answer_in_real_form(expression, always_include_decimal_point):
     answer, approximated = run_calc(expression)
+    return normalize_real_answer(answer, always_include_decimal_point), \
+        approximated
+
+
+def normalize_real_answer(answer, always_include_decimal_point):
     if always_include_decimal_point and re.match('^-?\d+$', answer):
         answer += ".0"
-    return answer, approximated
+    return answer
 
 
 def run_calc(expression):
     expr = expression.replace('x', '*').replace('[', '(').replace(']', ')')
-    result = subprocess.run(['calc', '-- '+expr], stdout=subprocess.PIPE)
-    answer = re.sub('^\t|\n$', '', result.stdout.decode('utf-8'))
+
+    if answer_cache is not None:
+        cached = answer_cache.get(expr)
+        if cached is not None:
+            return cached
+
+    answer = re.sub('^\t|\n$', '', calc_session.query(expr))
 
     approximated = (answer[0] == '~')
     if approximated:
         answer = answer[1:]
 
+    if answer_cache is not None:
+        answer_cache.put(expr, answer, approximated)
+
     return answer, approximated
 
 
@@ -0,0 +1,231 @@
+"""
+Exact arithmetic for the test tools: evaluates clc's elementary arithmetic
+expressions with fractions, and formats the answers the way calc prints
+them.
+
+The grammar is clc's: +, -, *, x, X and / between decimal numbers, unary
+signs, and () and [] for grouping.
+
+As in calc's answers, a division by zero gives an infinite quotient, which
+stays infinite through +, - and *, and divides any number but 0 into 0.
+Only an answer that is infinite raises CalcError, with calc's error code:
+10001 for divide by zero, 10002 for 0/0.
+"""
+
+from fractions import Fraction
+import re
+
+
+display_digits = 20
+
+divide_by_zero = 10001
+indeterminate = 10002
+
+
+class CalcError(Exception):
+    def __init__(self, code):
+        super(CalcError, self).__init__(code)
+        self.code = code
+
+
+class InfiniteQuotient():
+    """
+    The quotient of a division by zero, with the error code calc gives it
+    if it is the answer.
+    """
+
+    def __init__(self, code):
+        super(InfiniteQuotient, self).__init__()
+        self.code = code
+
+
+class Evaluator():
+    """
+    Evaluates an expression exactly, by recursive descent.
+    """
+
+    _token_regex = re.compile(r"\s*(\d+\.?\d*|\.\d+|[-+*xX/()\[\]])")
+    _opening_brackets = ('(', '[')
+    _closing_brackets = (')', ']')
+
+    def __init__(self, expr):
+        super(Evaluator, self).__init__()
+        self._tokens = self._tokenize(expr)
+        self._pos = 0
+
+    def _tokenize(self, expr):
+        tokens = []
+        pos = 0
+        expr = expr.rstrip()
+        while pos < len(expr):
+            match = self._token_regex.match(expr, pos)
+            if match is None:
+                raise SyntaxError(expr)
+            token = match.group(1)
+            tokens.append('*' if token in ('x', 'X') else token)
+            pos = match.end()
+        return tokens
+
+    def _peek(self):
+        if self._pos < len(self._tokens):
+            return self._tokens[self._pos]
+        return None
+
+    def _next(self):
+        token = self._peek()
+        self._pos += 1
+        return token
+
+    def evaluate(self):
+        value = self._expression()
+        if self._peek() is not None:
+            raise SyntaxError(self._peek())
+        if isinstance(value, InfiniteQuotient):
+            raise CalcError(value.code)
+        return value
+
+    def _expression(self):
+        value = self._term()
+        while self._peek() in ('+', '-'):
+            operator = self._next()
+            value = self._combine(value, self._term(), operator)
+        return value
+
+    def _term(self):
+        value = self._factor()
+        while self._peek() in ('*', '/'):
+            if self._next() == '*':
+                value = self._combine(value, self._factor(), '*')
+            else:
+                value = self._divide(value, self._factor())
+        return value
+
+    @staticmethod
+    def _combine(value, operand, operator):
+        """
+        Returns value + operand, value - operand or value * operand, which
+        is infinite if either of them is.
+        """
+        if isinstance(value, InfiniteQuotient):
+            return value
+        if isinstance(operand, InfiniteQuotient):
+            return operand
+        if operator == '+':
+            return value + operand
+        if operator == '-':
+            return value - operand
+        return value * operand
+
+    @staticmethod
+    def _divide(value, divisor):
+        if isinstance(value, InfiniteQuotient):
+            return value
+        if isinstance(divisor, InfiniteQuotient):
+            return divisor if value == 0 else Fraction(0)
+        if divisor == 0:
+            return InfiniteQuotient(indeterminate if value == 0
+                                    else divide_by_zero)
+        return value / divisor
+
+    def _factor(self):
+        token = self._next()
+        if token == '-':
+            value = self._factor()
+            if isinstance(value, InfiniteQuotient):
+                return value
+            return -value
+        if token == '+':
+            return self._factor()
+        # Like clc, any opening bracket can be closed by any closing one.
+        if token in self._opening_brackets:
+            value = self._expression()
+            if self._next() not in self._closing_brackets:
+                raise SyntaxError(')')
+            return value
+        if token is None or not (token[0].isdigit() or token[0] == '.'):
+            raise SyntaxError(token)
+        return Fraction(token)
+
+
+def evaluate(expr):
+    return Evaluator(expr).evaluate()
+
+
+def round_to(value, num_decimals):
+    """
+    Returns value rounded half to even to num_decimals places, scaled up
+    into an integer.
+    """
+    return round(value * 10**num_decimals)
+
+
+def strip_trailing_zeros(text):
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return text
+
+
+def format_fixed(value, num_decimals):
+    """
+    Returns value as calc's printf("%.nf") does: rounded to num_decimals
+    places, with the trailing zeros of an exact value stripped, e.g. 3.90751
+    rather than 3.907510000000.
+    """
+    text = pad_fixed(value, num_decimals)
+    if not is_approximation(text, value):
+        text = strip_trailing_zeros(text)
+    return text
+
+
+def pad_fixed(value, num_decimals):
+    """
+    Returns value rounded to num_decimals places, with all of them written.
+    """
+    scaled = round_to(value, num_decimals)
+    sign = '-' if scaled < 0 else ''
+    digits = str(abs(scaled)).rjust(num_decimals + 1, '0')
+    if num_decimals == 0:
+        return sign + digits
+    return sign + digits[:-num_decimals] + '.' + digits[-num_decimals:]
+
+
+def format_exponential(value, num_decimals, strip_zeros=False):
+    """
+    Returns value as calc's printf("%.ne") does, e.g. 1.25e-3, with its
+    exponent unpadded. strip_zeros strips the trailing zeros of an exact
+    mantissa, as printf("%e") does.
+    """
+    if value == 0:
+        return '0'
+    exponent = 0
+    magnitude = abs(value)
+    while magnitude >= 10:
+        magnitude /= 10
+        exponent += 1
+    while magnitude < 1:
+        magnitude *= 10
+        exponent -= 1
+    mantissa = pad_fixed(magnitude, num_decimals)
+    if mantissa.startswith('10'):
+        exponent += 1
+        mantissa = pad_fixed(magnitude / 10, num_decimals)
+    sign = '-' if value < 0 else ''
+    if strip_zeros and not is_approximation(mantissa + 'e' + str(exponent),
+                                            abs(value)):
+        mantissa = strip_trailing_zeros(mantissa)
+    return sign + mantissa + 'e' + str(exponent)
+
+
+def is_approximation(text, value):
+    return Fraction(text) != value
+
+
+def display(value):
+    """
+    Returns value the way calc displays it, with a ~ in front if rounded.
+    Only exact values have their trailing zeros stripped.
+    """
+    text = format_fixed(value, display_digits)
+    if is_approximation(text, value):
+        return '~' + text
+    return text
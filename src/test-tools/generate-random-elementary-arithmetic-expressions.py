@@ -17,11 +17,23 @@ https://stackoverflow.com/questions/6881170/is-there-a-way-to-autogenerate-valid
 
 from __future__ import print_function
 
+from bisect import bisect_left
+from collections import Counter, deque, namedtuple
+import contextlib
 from enum import Enum
 import getopt
+import io
+import json
+import multiprocessing
+import os
 import random
-import re
 import sys
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class Operators(Enum):
@@ -34,88 +46,212 @@ class Operators(Enum):
     ADDITION_SUBTRACTION_MULTIPLICATION_DIVISION = 7
 
 
+# Operators by --operators option.
+operators_by_option = {
+    'a': Operators.ADDITION,
+    's': Operators.SUBTRACTION,
+    'm': Operators.MULTIPLICATION,
+    'd': Operators.DIVISION,
+    'as': Operators.ADDITION_SUBTRACTION,
+    'md': Operators.MULTIPLICATION_DIVISION,
+    'asmd': Operators.ADDITION_SUBTRACTION_MULTIPLICATION_DIVISION
+}
+
+
+class WeightedRandomPicker():
+    """
+    Randomly picks items according to their probabilities.
+
+    The cumulative probabilities are summed once, when the picker is built.
+    Each pick is then a binary search over them and returns exactly the item
+    a linear scan for the first cumulative probability >= random.random()
+    would return.
+    """
+
+    def __init__(self, items, probabilities):
+        super(WeightedRandomPicker, self).__init__()
+
+        self._items = list(items)
+        probabilities = list(probabilities)
+        self._cumulative_probabilities = []
+        cumulative = 0.0
+        for prob in probabilities:
+            cumulative += prob
+            self._cumulative_probabilities.append(cumulative)
+        assert len(self._items) == len(self._cumulative_probabilities)
+
+        # Floating-point sums may fall a hair short of 1.0. Random numbers
+        # past the total go to the last item that can be picked at all.
+        nonzero_indices = [i for i, prob in enumerate(probabilities)
+                           if prob > 0]
+        assert nonzero_indices, "No item has a nonzero probability."
+        self._last_index = nonzero_indices[-1]
+
+    @classmethod
+    def from_weights(cls, items, weights):
+        """
+        Builds a picker from weights that need not add up to 1.0.
+        """
+        weights = list(weights)
+        total = sum(weights)
+        return cls(items, [weight / total for weight in weights])
+
+    def pick(self):
+        i = bisect_left(self._cumulative_probabilities, random.random())
+        return self._items[min(i, self._last_index)]
+
+
 class OperandGenerator():
     def __init__(self, generator_list):
         super(OperandGenerator, self).__init__()
         self._generators_list = generator_list
+        self._generator_picker = WeightedRandomPicker(
+            [o['generator'] for o in generator_list],
+            [o['prob'] for o in generator_list])
+        self._generator_pickers_by_len = {}
+        self._possible_lens = {}
 
     def randomly_generate(self):
-        r = random.random()
-        cumulative = 0.0
-        for o in self._generators_list:
-            cumulative += o['prob']
-            if r <= cumulative:
-                generator = o['generator']
-                break
+        generator = self._generator_picker.pick()
         return generator()
 
-    @classmethod
-    def get_integer_generator(cls, integer_len, operators):
-        GenerateInteger().integer_len = integer_len
-        if integer_len == 1 and (operators == Operators.MULTIPLICATION
+    def len_probabilities(self, negative):
+        """
+        Returns the probability of randomly generating an operand rendered in
+        each number of characters and starting with '-' if negative is true.
+        """
+        len_probs = {}
+        for o in self._generators_list:
+            for n, prob in o['generator'].len_probabilities(negative).items():
+                len_probs[n] = len_probs.get(n, 0.0) + o['prob'] * prob
+        return len_probs
+
+    def possible_lens(self, negative):
+        """
+        Returns the lengths an operand starting with '-' if negative is true
+        can be rendered in.
+        """
+        possible_lens = self._possible_lens.get(negative)
+        if possible_lens is None:
+            possible_lens = frozenset(n for n, prob
+                                      in self.len_probabilities(
+                                          negative).items()
+                                      if prob > 0)
+            self._possible_lens[negative] = possible_lens
+        return possible_lens
+
+    def can_generate_with_len(self, rendered_len, negative):
+        return rendered_len in self.possible_lens(negative)
+
+    def randomly_generate_with_len(self, rendered_len, negative):
+        """
+        Generates an operand rendered in exactly rendered_len characters,
+        starting with '-' if negative is true. The operand type is picked in
+        proportion to how likely it is to be generated that way.
+        """
+        key = (rendered_len, negative)
+        generator_picker = self._generator_pickers_by_len.get(key)
+        if generator_picker is None:
+            generator_picker = WeightedRandomPicker.from_weights(
+                [o['generator'] for o in self._generators_list],
+                [o['prob'] * o['generator'].len_probabilities(negative).get(
+                    rendered_len, 0.0) for o in self._generators_list])
+            self._generator_pickers_by_len[key] = generator_picker
+        generator = generator_picker.pick()
+        return generator.generate_with_len(rendered_len, negative)
+
+    @staticmethod
+    def avoid_many_zeroes(integer_len, operators):
+        return integer_len == 1 and (operators == Operators.MULTIPLICATION
             or operators == Operators.DIVISION
-            or operators == Operators.MULTIPLICATION_DIVISION):
-            GenerateInteger().avoid_many_zeroes = True
+            or operators == Operators.MULTIPLICATION_DIVISION)
+
+    @classmethod
+    def get_integer_generator(cls, integer_len, operators, operand_pool):
         return OperandGenerator([
-            {'prob': 1.0, 'generator': GenerateInteger}
+            {'prob': 1.0,
+             'generator': GenerateInteger(
+                 operand_pool, integer_len,
+                 cls.avoid_many_zeroes(integer_len, operators))}
         ])
 
     @classmethod
-    def get_float_generator(cls, float_len):
-        GenerateFloat().float_len = float_len
+    def get_float_generator(cls, float_len, operand_pool):
         return OperandGenerator([
-            {'prob': 1.0, 'generator': GenerateFloat}
+            {'prob': 1.0, 'generator': GenerateFloat(operand_pool, float_len)}
         ])
 
     @classmethod
     def get_integer_and_float_generator(cls, operators, integer_len,
-                                        float_len):
-        GenerateInteger().integer_len = integer_len
-        if integer_len == 1 and (operators == Operators.MULTIPLICATION
-            or operators == Operators.DIVISION
-            or operators == Operators.MULTIPLICATION_DIVISION):
-            GenerateInteger().avoid_many_zeroes = True
-        GenerateFloat().float_len = float_len
+                                        float_len, operand_pool):
         return OperandGenerator([
-            {'prob': 0.5, 'generator': GenerateInteger},
-            {'prob': 0.5, 'generator': GenerateFloat}
+            {'prob': 0.5,
+             'generator': GenerateInteger(
+                 operand_pool, integer_len,
+                 cls.avoid_many_zeroes(integer_len, operators))},
+            {'prob': 0.5, 'generator': GenerateFloat(operand_pool, float_len)}
         ])
 
+    @classmethod
+    def get(cls, operators, integer_len, float_len, operand_pool):
+        if integer_len is not None and float_len is None:
+            return cls.get_integer_generator(integer_len, operators,
+                                             operand_pool)
+        if integer_len is None and float_len is not None:
+            return cls.get_float_generator(float_len, operand_pool)
+        return cls.get_integer_and_float_generator(operators, integer_len,
+                                                   float_len, operand_pool)
+
+
+# An operator as it appears in an expression. Only one Operator exists for
+# each symbol and spacing; every expression using it shares that one.
+Operator = namedtuple('Operator', ['symbol', 'prec', 'display'])
+
 
 class OperatorGenerator():
+    _spaces_dict = {'': 0.499, ' ': 0.499, '  ': 0.0018, '   ': 0.0002}
+    _spaces_picker = WeightedRandomPicker(_spaces_dict.keys(),
+                                          _spaces_dict.values())
+
     def __init__(self, operators_dict, num_of_spaces_around_operator):
         super(OperatorGenerator, self).__init__()
         self._operators_dict = operators_dict
         self._number_of_spaces_around_operator = num_of_spaces_around_operator
+        self._operator_picker = WeightedRandomPicker(
+            operators_dict.items(),
+            [v['prob'] for v in operators_dict.values()])
+
+        if num_of_spaces_around_operator is not None:
+            self._spaces_probs = {" " * num_of_spaces_around_operator: 1.0}
+        else:
+            self._spaces_probs = self._spaces_dict
+        self._operators = {
+            (k, spaces): Operator(k, v['prec'], spaces + k + spaces)
+            for k, v in operators_dict.items() for spaces in self._spaces_probs
+        }
 
     def randomly_pick(self):
-        r = random.random()
-        cumulative = 0.0
-        for k, v in self._operators_dict.items():
-            cumulative += v['prob']
-            if r <= cumulative:
-                operator = k
-                break
-        assert operator is not None
+        k, v = self._operator_picker.pick()
 
         if self._number_of_spaces_around_operator is not  None:
             spaces = " " * self._number_of_spaces_around_operator
         else:
-            spaces_dict = {'': 0.499, ' ': 0.499, '  ': 0.0018, '   ': 0.0002}
-            r = random.random()
-            cumulative = 0.0
-            for spaces_key, prob in spaces_dict.items():
-                cumulative += prob
-                if r <= cumulative:
-                    spaces = spaces_key
-                    break
-            assert spaces is not None
+            spaces = self._spaces_picker.pick()
 
-        return {
-            'symbol': k,
-            'prec': v['prec'],
-            'display': spaces + k + spaces
-        }
+        return self._operators[(k, spaces)]
+
+    def possible_operators(self):
+        """
+        Returns every operator randomly_pick can return, paired with the
+        probability of picking it.
+        """
+        operators = []
+        for k, v in self._operators_dict.items():
+            for spaces, spaces_prob in self._spaces_probs.items():
+                prob = v['prob'] * spaces_prob
+                if prob > 0:
+                    operators.append((self._operators[(k, spaces)], prob))
+        return operators
 
     @classmethod
     def get(cls, operators, num_of_spaces_around_operator):
@@ -209,177 +345,300 @@ class MathExpression(object):
             return operand
 
 
-class GenerateInteger():
-    _avoid_many_zeroes = False
+class OperandPool():
+    """
+    Hands out random unsigned operands, already rendered, from pools kept
+    for each number of digits and of decimals.
+
+    With NumPy installed, a pool that runs dry is refilled with twice as
+    many operands as last time, up to max_batch_size, so operands rarely
+    asked for are not drawn in bulk. Batches smaller than
+    numpy_min_batch_size, and every operand without NumPy, are drawn one at
+    a time with random. Operands are rendered from their digits, never
+    through binary floating point, so every digit of a 19-digit float is
+    the one drawn.
+
+    Batches are seeded from random, so reset() after random.seed() gives
+    the same operands for the same seed. With or without NumPy, operands
+    differ.
+    """
+
+    numpy_min_batch_size = 64
+
+    def __init__(self, max_batch_size=1):
+        super(OperandPool, self).__init__()
+        self.reset(max_batch_size)
+
+    def reset(self, max_batch_size=None):
+        if max_batch_size is not None:
+            self._max_batch_size = max(1, max_batch_size)
+        self._pools = {}
+        self._batch_sizes = {}
+
+    def take(self, num_digits, num_decimals=0):
+        """
+        Returns a random unsigned operand of num_digits digits, num_decimals
+        of them decimals. Integers of more than one digit do not start with
+        0; floats of as many decimals as digits start with 0.
+        """
+        key = (num_digits, num_decimals)
+        pool = self._pools.get(key)
+        if not pool:
+            batch_size = 1
+            if numpy is not None:
+                batch_size = min(self._batch_sizes.get(key, 0) * 2 or 1,
+                                 self._max_batch_size)
+            self._batch_sizes[key] = batch_size
+            pool = self._draw(num_digits, num_decimals, batch_size)
+            self._pools[key] = pool
+        return pool.pop()
+
+    def _draw(self, num_digits, num_decimals, batch_size):
+        low = 0 if num_digits == 1 else 10 ** (num_digits - 1)
+        high = 10**num_digits - 1
+        if numpy is not None and batch_size >= self.numpy_min_batch_size:
+            rng = numpy.random.default_rng(random.getrandbits(64))
+            # 19 digits still fit in a uint64.
+            digits = rng.integers(low, high, size=batch_size,
+                                  dtype=numpy.uint64,
+                                  endpoint=True).astype(str).tolist()
+        else:
+            digits = [str(random.randint(low, high))
+                      for i in range(batch_size)]
+
+        if num_decimals == 0:
+            return digits
+        if num_decimals == num_digits:
+            return ['0.' + d for d in digits]
+        point = num_digits - num_decimals
+        return [d[:point] + '.' + d[point:] for d in digits]
 
-    # if None, integer length is randomly chosen from _integer_len_range
-    _integer_len = None
+
+class Operand():
+    """
+    A number as it appears in an expression.
+    """
+
+    __slots__ = ('_str',)
+
+    def __init__(self, rendered):
+        super(Operand, self).__init__()
+        self._str = rendered
+
+    def __str__(self):
+        return self._str
+
+    def __len__(self):
+        return len(self._str)
+
+    def starts_with(self, char):
+        return self._str[0] == char
+
+    def precedence(self):
+        return 0
+
+
+class GenerateInteger():
+    """
+    Generates random integer operands of one profile. Calling it returns an
+    Operand.
+    """
 
     # 9522868949551080827L // gcc warning: integer const so large it's unsigned
     # 9000000000000000000L // no gcc warning
-    _integer_len_range = range(1, 19 + 1) # 1 to 19 digits long
+    integer_len_range = range(1, 19 + 1) # 1 to 19 digits long
     _random_integer_len_distribution = [
         0.0500, 0.3270, 0.3260, 0.2310, 0.0410, 0.0110, 0.0062, 0.0012, 0.0011,
         0.0010, 0.0009, 0.0008, 0.0007, 0.0006, 0.0005, 0.0004, 0.0003, 0.0002,
         0.0001
     ]
-    assert len(_integer_len_range) == len(_random_integer_len_distribution)
+    assert len(integer_len_range) == len(_random_integer_len_distribution)
     assert sum(_random_integer_len_distribution) == 1.0
+    _integer_len_picker = WeightedRandomPicker(
+        integer_len_range, _random_integer_len_distribution)
+
+    def __init__(self, operand_pool, integer_len=None,
+                 avoid_many_zeroes=False):
+        """
+        integer_len: number of digits; None or 99 for a random length.
+        """
+        super(GenerateInteger, self).__init__()
 
-    @property
-    def avoid_many_zeroes(self):
-        return type(self)._avoid_many_zeroes
+        if integer_len == 99:
+            integer_len = None
+        if integer_len is not None:
+            assert integer_len in self.integer_len_range, \
+                "%r not in %r" % (integer_len, self.integer_len_range)
 
-    @avoid_many_zeroes.setter
-    def avoid_many_zeroes(self, val):
-        type(self)._avoid_many_zeroes = val
+        self._operand_pool = operand_pool
+        self._integer_len = integer_len
+        self._avoid_many_zeroes = avoid_many_zeroes
 
     @property
     def integer_len(self):
-        return type(self)._integer_len
-
-    @integer_len.setter
-    def integer_len(self, val):
-        if val == 99:
-            val = None
-        if val is not None:
-            assert val in self._integer_len_range, \
-                "%r not in %r" % (val, self._integer_len_range)
-        type(self)._integer_len = val
+        return self._integer_len
 
     @property
-    def integer_len_range(self):
-        return type(self)._integer_len_range
-
-    def _randomly_choose_integer_len(self):
-        random_integer_len = None
-
-        r = random.random()
-        cumulative = 0.0
-        for i in range(len(self._random_integer_len_distribution)):
-            cumulative += self._random_integer_len_distribution[i]
-            if r <= cumulative:
-                random_integer_len = i + 1
-                break
-        assert random_integer_len is not None
-        return random_integer_len
-
-    def __init__(self):
-        super(GenerateInteger, self).__init__()
+    def avoid_many_zeroes(self):
+        return self._avoid_many_zeroes
+
+    def _integer_len_probabilities(self):
+        if self._integer_len is not None:
+            return {self._integer_len: 1.0}
+        return {integer_len: prob for integer_len, prob
+                in zip(self.integer_len_range,
+                       self._random_integer_len_distribution)
+                if prob > 0}
+
+    def len_probabilities(self, negative):
+        sign_len = 1 if negative else 0
+        return {sign_len + integer_len: 0.5 * prob for integer_len, prob
+                in self._integer_len_probabilities().items()}
+
+    def generate_with_len(self, rendered_len, negative):
+        return self(rendered_len - (1 if negative else 0), negative)
+
+    def __call__(self, integer_len=None, negative=None):
+        if negative is None:
+            sign = -1 if random.random() <= 0.5 else 1
+        else:
+            sign = -1 if negative else 1
 
-        sign = -1 if random.random() <= 0.5 else 1
+        if integer_len is None:
+            if self._integer_len is None:
+                integer_len = self._integer_len_picker.pick()
+            else:
+                integer_len = self._integer_len
 
-        if self._integer_len is None:
-            integer_len = self._randomly_choose_integer_len()
-        else:
-            integer_len = self._integer_len
-        if integer_len == 1:
-            integer_range = (0, 9)
-        else:
-            integer_range = (
-                10 ** (integer_len - 1),
-                10**integer_len - 1
-            )
         while True:
-            self.value = sign * random.randint(integer_range[0],
-                                               integer_range[1])
+            digits = self._operand_pool.take(integer_len)
+            if digits != '0':
+                break
+            # -0 would be rendered as 0.
+            if negative:
+                continue
             if (self._avoid_many_zeroes == False
-                or self.value != 0 or random.random() <= 0.001):
+                or random.random() <= 0.001):
+                sign = 1
                 break
 
-    def __str__(self):
-        return self.value.__str__()
-
-    def __len__(self):
-        return len(self.__str__())
-
-    def precedence(self):
-        return 0
+        return Operand(digits if sign > 0 else '-' + digits)
 
 
 class GenerateFloat():
-    # if None, integer part length is randomly chosen
-    # from _float_len_range
-    _float_len = None
+    """
+    Generates random float operands of one profile. Calling it returns an
+    Operand.
+    """
 
-    _float_len_range = range(1, 19 + 1)
+    float_len_range = range(1, 19 + 1)
     _random_float_len_distribution = [
         0.1850, 0.1900, 0.2000, 0.2000, 0.2000, 0.0110, 0.0062, 0.0012, 0.0011,
         0.0010, 0.0009, 0.0008, 0.0007, 0.0006, 0.0005, 0.0004, 0.0003, 0.0002,
         0.0001
     ]
-    assert len(_float_len_range) == \
+    assert len(float_len_range) == \
         len(_random_float_len_distribution)
     assert round(sum(_random_float_len_distribution), 15) == 1.0
+    _float_len_picker = WeightedRandomPicker(
+        float_len_range, _random_float_len_distribution)
 
-    _num_decimals = 0
+    def __init__(self, operand_pool, float_len=None):
+        """
+        float_len: number of digits; None or 99 for a random length.
+        """
+        super(GenerateFloat, self).__init__()
 
-    @property
-    def float_len(self):
-        return type(self)._float_len
+        if float_len == 99:
+            float_len = None
+        if float_len is not None:
+            assert float_len in self.float_len_range, \
+                "%r not in %r" % (float_len, self.float_len_range)
 
-    @float_len.setter
-    def float_len(self, val):
-        if val == 99:
-            val = None
-        if val is not None:
-            assert val in self._float_len_range, \
-                "%r not in %r" % (val, self._float_len_range)
-        type(self)._float_len = val
+        self._operand_pool = operand_pool
+        self._float_len = float_len
+        # (float length, number of decimals) pickers by rendered length
+        # without sign.
+        self._layout_pickers = {}
 
     @property
-    def float_len_range(self):
-        return type(self)._float_len_range
-
-    def _randomly_pick_float_len(self):
-        random_float_len = None
-        r = random.random()
-        cumulative = 0.0
-        for i in range(len(self._random_float_len_distribution)):
-            cumulative += self._random_float_len_distribution[i]
-            if r <= cumulative:
-                random_float_len = i + 1
-                break
-        assert random_float_len is not None
-        return random_float_len
-
-    def __init__(self):
-        super(GenerateFloat, self).__init__()
-
-        sign = -1 if random.random() <= 0.5 else 1
-
-        if self._float_len is None:
-            float_len = self._randomly_pick_float_len()
-        else:
-            float_len = self._float_len
-        if float_len == 1:
-            float_integer_part_range = (0, 9)
+    def float_len(self):
+        return self._float_len
+
+    def _float_len_probabilities(self):
+        if self._float_len is not None:
+            return {self._float_len: 1.0}
+        return {float_len: prob for float_len, prob
+                in zip(self.float_len_range,
+                       self._random_float_len_distribution)
+                if prob > 0}
+
+    def len_probabilities(self, negative):
+        # n digits with fewer than n decimals, e.g. 12.3: n+1 characters.
+        # n digits, all decimals, e.g. 0.123: n+2 characters.
+        # The number of decimals is uniformly picked from 1 to n.
+        sign_len = 1 if negative else 0
+        len_probs = {}
+        for float_len, prob in self._float_len_probabilities().items():
+            prob *= 0.5
+            n = sign_len + float_len + 1
+            len_probs[n] = (len_probs.get(n, 0.0)
+                            + prob * (float_len - 1) / float_len)
+            n += 1
+            len_probs[n] = len_probs.get(n, 0.0) + prob / float_len
+        return {n: prob for n, prob in len_probs.items() if prob > 0}
+
+    def _randomly_pick_float_len_and_num_decimals(self, unsigned_len):
+        layout_picker = self._layout_pickers.get(unsigned_len)
+        if layout_picker is None:
+            # Number of decimals is uniformly picked from 1 to float_len.
+            layouts = []
+            probs = []
+            for float_len, prob in self._float_len_probabilities().items():
+                if float_len + 1 == unsigned_len:
+                    num_decimals_range = range(1, float_len)
+                elif float_len + 2 == unsigned_len:
+                    num_decimals_range = range(float_len, float_len + 1)
+                else:
+                    continue
+                for num_decimals in num_decimals_range:
+                    layouts.append((float_len, num_decimals))
+                    probs.append(prob / float_len)
+            assert layouts, "No float of length %r" % unsigned_len
+            layout_picker = WeightedRandomPicker.from_weights(layouts, probs)
+            self._layout_pickers[unsigned_len] = layout_picker
+        return layout_picker.pick()
+
+    def generate_with_len(self, rendered_len, negative):
+        unsigned_len = rendered_len - (1 if negative else 0)
+        float_len, num_decimals = \
+            self._randomly_pick_float_len_and_num_decimals(unsigned_len)
+        return self(float_len, num_decimals, negative)
+
+    def __call__(self, float_len=None, num_decimals=None, negative=None):
+        if negative is None:
+            sign = -1 if random.random() <= 0.5 else 1
         else:
-            float_integer_part_range = (
-                10 ** (float_len - 1),
-                10**float_len - 1
-            )
-
-        float_integer_part = random.randint(float_integer_part_range[0],
-                                            float_integer_part_range[1])
-        
-        self._num_decimals = random.randint(1, float_len)
-
-        self.value = sign * (
-            float_integer_part / 10**self._num_decimals
-        )
+            sign = -1 if negative else 1
 
-    def __str__(self):
-        return '{:.{prec}f}'.format(self.value, prec=self._num_decimals)
+        if float_len is None:
+            if self._float_len is None:
+                float_len = self._float_len_picker.pick()
+            else:
+                float_len = self._float_len
 
-    def __len__(self):
-        return len(self.__str__())
+        if num_decimals is None:
+            num_decimals = random.randint(1, float_len)
 
-    def precedence(self):
-        return 0
+        # Like -0.0, a negative float is always rendered with its sign.
+        rendered = self._operand_pool.take(float_len, num_decimals)
+        return Operand(rendered if sign > 0 else '-' + rendered)
 
 
 class BinaryExpression():
+    __slots__ = ('operator', 'left', 'right', '_left_brackets',
+                 '_right_brackets', '_len', '_str')
+
     def __init__(self, operator, left_expression, right_expression):
         super(BinaryExpression, self).__init__()
 
@@ -387,6 +646,26 @@ class BinaryExpression():
         self.left = left_expression
         self.right = right_expression
 
+        # Brackets are picked once, here, so that the expression renders the
+        # same way every time and its length can be worked out bottom-up
+        # from the lengths its subexpressions already know.
+        op_str = self.operator.display
+
+        self._left_brackets = ()
+        if self.left.precedence() > self.precedence():
+            self._left_brackets = (randomly_pick_brackets(),)
+
+        self._right_brackets = ()
+        if self.right.precedence() > self.precedence():
+            self._right_brackets = (randomly_pick_brackets(),)
+        if (op_str == '+' or op_str == '-') and self.right.starts_with('-'):
+            self._right_brackets += (randomly_pick_brackets(),)
+
+        self._len = (len(self.left) + 2 * len(self._left_brackets)
+                     + len(op_str)
+                     + len(self.right) + 2 * len(self._right_brackets))
+        self._str = None
+
     @classmethod
     def create_random(cls, level, sub_expressions, operand_generator,
                       operator_generator):
@@ -402,130 +681,869 @@ class BinaryExpression():
         return BinaryExpression(operator, left, right)
 
     def precedence(self):
-        return self.operator['prec']
+        return self.operator.prec
 
-    def __str__(self):
-        left_str = self.left.__str__()
-        right_str = self.right.__str__()
-        op_str = self.operator['display']
+    def starts_with(self, char):
+        if self._left_brackets:
+            return self._left_brackets[-1][0] == char
+        return self.left.starts_with(char)
 
-        if self.left.precedence() > self.precedence():
-            left_str = enclose_expression_in_brackets(left_str)
-        if self.right.precedence() > self.precedence():
-            right_str = enclose_expression_in_brackets(right_str)
+    def __str__(self):
+        if self._str is None:
+            left_str = self.left.__str__()
+            for left_bracket, right_bracket in self._left_brackets:
+                left_str = left_bracket + left_str + right_bracket
 
-        if (op_str == '+' or op_str == '-') and self.right.__str__()[0] == '-':
-            right_str = enclose_expression_in_brackets(right_str)
+            right_str = self.right.__str__()
+            for left_bracket, right_bracket in self._right_brackets:
+                right_str = left_bracket + right_str + right_bracket
 
-        return left_str + op_str + right_str
+            self._str = left_str + self.operator.display + right_str
+            assert len(self._str) == self._len
+        return self._str
 
     def __len__(self):
-        return len(self.__str__())
+        return self._len
+
+
+class ExpressionLengthIndex():
+    """
+    Indexes expressions by their rendered length so that the one nearest to a
+    desired length is found with a binary search instead of a full scan.
+
+    Of the expressions equally near, the one added first wins.
+    """
+
+    def __init__(self, expressions):
+        super(ExpressionLengthIndex, self).__init__()
+
+        # Only the first expression of each length can ever be picked.
+        self._first_by_len = {}
+        for order, expr in enumerate(expressions):
+            self._first_by_len.setdefault(len(expr), (order, expr))
+        self._lens = sorted(self._first_by_len)
+
+    def find_nearest_len(self, desired_len):
+        i = bisect_left(self._lens, desired_len)
+        candidates = [self._first_by_len[self._lens[j]]
+                      for j in (i - 1, i) if 0 <= j < len(self._lens)]
+        order, expr = min(candidates,
+                          key=lambda c: (abs(len(c[1]) - desired_len), c[0]))
+        return expr
 
 
 class Expression(object):
+    """
+    Generates an expression of a desired length by building random
+    expressions and editing the one nearest in length until it fits.
+
+    Every edit is made on the expression tree and its exact change in
+    length is worked out before it is made:
+    - lengthening joins the expression and a subexpression with an
+      operator, brackets included;
+    - repairing swaps an operand for one of another length, drops the
+      minus of a negative operand, with the brackets it needed, or merges a
+      subexpression into one of its operands.
+    """
+
     def __init__(self):
         super(Expression, self).__init__()
 
     def precedence(self):
         return -1
 
-    def _lengthen_expression(cls, expr, desired_expression_len,
-                             operator_generator, sub_expressions):
+    @staticmethod
+    def _lengthen_expression(expr, desired_expression_len,
+                             operator_generator, sub_expressions_index,
+                             stats):
         while (len(expr) < desired_expression_len):
-            operator = operator_generator.randomly_pick()['display']
-            expr += operator
+            stats.count('lengthening_operators')
+            operator = operator_generator.randomly_pick()
 
-            sub_expression_len_needed = desired_expression_len - len(expr)
+            sub_expression_len_needed = (desired_expression_len - len(expr)
+                                         - len(operator.display))
             if sub_expression_len_needed < 0:
                 sub_expression_len_needed = 0
-            sub_expression = cls._find_best_expression_having_certain_len(
-                sub_expressions, sub_expression_len_needed).__str__()
-
-            if ((operator == '+' or operator == '-')
-                and sub_expression[0] == '-'):
-                sub_expression = enclose_expression_in_brackets(sub_expression)
+            sub_expression = sub_expressions_index.find_nearest_len(
+                sub_expression_len_needed)
 
-            expr += sub_expression
+            expr = BinaryExpression(operator, expr, sub_expression)
 
         return expr
 
-    def _shorten_expression(expr, desired_expression_len):
-        number_chars_to_shorten = len(expr) - desired_expression_len
-
-        num_parentheses_to_remove = number_chars_to_shorten // 3
-        if num_parentheses_to_remove > 0:
-            neg_number_in_brackets_regex = re.compile(r"[(\[]-(\d+)[)\]]")
-            (expr, num_replacements_made) = neg_number_in_brackets_regex.subn(
-                r"\1", expr, num_parentheses_to_remove)
-            number_chars_to_shorten -= (num_replacements_made * 3)
-        num_negations = number_chars_to_shorten
-        if num_negations > 0:
-            neg_number_no_brackets_regex = re.compile(r"(^|(?<=[x*/ ]))-(\d+)")
-            (expr, num_replacements_made) = neg_number_no_brackets_regex.subn(
-                r"\2", expr, num_negations)
-            number_chars_to_shorten -= num_replacements_made
-
+    @staticmethod
+    def _operands_and_subexpressions(expr):
+        """
+        Returns the operands and the subexpressions of expr, each with its
+        path: the (BinaryExpression, is left operand) pairs leading to it
+        from expr.
+        """
+        operands = []
+        sub_expressions = []
+        stack = [(expr, ())]
+        while stack:
+            node, path = stack.pop()
+            if isinstance(node, BinaryExpression):
+                sub_expressions.append((node, path))
+                stack.append((node.right, path + ((node, False),)))
+                stack.append((node.left, path + ((node, True),)))
+            else:
+                operands.append((node, path))
+        return operands, sub_expressions
+
+    @staticmethod
+    def _len_after_replacing(node, path, replacement):
+        """
+        Returns the length the whole expression would have if node, at the
+        end of path, were replaced by replacement. Going up the path, the
+        brackets each parent puts around the replaced operand are worked out
+        the way BinaryExpression picks them.
+        """
+        old_len, new_len = len(node), len(replacement)
+        old_minus = node.starts_with('-')
+        new_minus = replacement.starts_with('-')
+        old_prec, new_prec = node.precedence(), replacement.precedence()
+
+        for parent, is_left in reversed(path):
+            parent_prec = parent.precedence()
+            op_str = parent.operator.display
+            minus_rule = (not is_left) and (op_str == '+' or op_str == '-')
+
+            old_brackets = ((1 if old_prec > parent_prec else 0)
+                            + (1 if minus_rule and old_minus else 0))
+            new_brackets = ((1 if new_prec > parent_prec else 0)
+                            + (1 if minus_rule and new_minus else 0))
+            new_len = (len(parent) - old_len - 2 * old_brackets
+                       + new_len + 2 * new_brackets)
+            old_len = len(parent)
+
+            old_minus_parent = parent.starts_with('-')
+            if is_left:
+                new_minus = new_minus and new_brackets == 0
+            else:
+                new_minus = old_minus_parent
+            old_minus = old_minus_parent
+            old_prec = new_prec = parent_prec
+        return new_len
+
+    @staticmethod
+    def _replace(path, replacement):
+        expr = replacement
+        for parent, is_left in reversed(path):
+            if is_left:
+                expr = BinaryExpression(parent.operator, expr, parent.right)
+            else:
+                expr = BinaryExpression(parent.operator, parent.left, expr)
         return expr
 
-    def _find_best_expression_having_certain_len(sub_expressions, desired_len):
-        best_expression = None
-
-        for expr in sub_expressions:
-            if best_expression is None:
-                best_expression = expr
-                continue
-
-            expr_len_diff = expr.__len__() - desired_len
-            best_expression_len_diff = best_expression.__len__() - desired_len
-
-            if abs(expr_len_diff) < abs(best_expression_len_diff):
-                best_expression = expr
+    @classmethod
+    def _pick_edit(cls, expr, desired_expression_len, operand_generator):
+        """
+        Returns the edit, as (path, replacement node, length it gives
+        expr), that brings expr nearest to the desired length, or None if
+        none brings it any nearer. An edit hitting the desired length is
+        picked at random among those that do.
+        """
+        len_change = desired_expression_len - len(expr)
+        operands, sub_expressions = cls._operands_and_subexpressions(expr)
+
+        # Swapping an operand for one of the same sign changes nothing else.
+        exact_swaps = [
+            (operand, path) for operand, path in operands
+            if operand_generator.can_generate_with_len(
+                len(operand) + len_change, operand.starts_with('-'))]
+        if exact_swaps:
+            operand, path = random.choice(exact_swaps)
+            return (path, operand_generator.randomly_generate_with_len(
+                        len(operand) + len_change, operand.starts_with('-')),
+                    desired_expression_len)
+
+        best = None
+        best_distance = abs(len_change)
+        for operand, path in operands:
+            negative = operand.starts_with('-')
+            for rendered_len in operand_generator.possible_lens(negative):
+                distance = abs(len_change - (rendered_len - len(operand)))
+                if distance < best_distance:
+                    best_distance = distance
+                    best = (operand, path, 'swap', rendered_len)
+            if negative:
+                replacement = Operand(operand.__str__()[1:])
+                new_len = cls._len_after_replacing(operand, path,
+                                                   replacement)
+                distance = abs(desired_expression_len - new_len)
+                if distance < best_distance:
+                    best_distance = distance
+                    best = (operand, path, replacement, new_len)
+        for sub_expression, path in sub_expressions:
+            for replacement in (sub_expression.left, sub_expression.right):
+                new_len = cls._len_after_replacing(sub_expression, path,
+                                                   replacement)
+                distance = abs(desired_expression_len - new_len)
+                if distance < best_distance:
+                    best_distance = distance
+                    best = (sub_expression, path, replacement, new_len)
+
+        if best is None:
+            return None
+        node, path, replacement, new_len = best
+        if replacement == 'swap':
+            rendered_len = new_len
+            new_len = len(expr) + rendered_len - len(node)
+            replacement = operand_generator.randomly_generate_with_len(
+                rendered_len, node.starts_with('-'))
+        return path, replacement, new_len
 
-        return best_expression
+    @classmethod
+    def _repair_expression(cls, expr, desired_expression_len,
+                           operand_generator, stats):
+        """
+        Edits expr until it has the desired length or no edit brings it any
+        nearer. Each edit brings it strictly nearer, so this ends.
+        """
+        while len(expr) != desired_expression_len:
+            edit = cls._pick_edit(expr, desired_expression_len,
+                                  operand_generator)
+            if edit is None:
+                break
+            stats.count('repair_edits')
+            path, replacement, new_len = edit
+            expr = cls._replace(path, replacement)
+            assert len(expr) == new_len
+        return expr
 
     @classmethod
     def generate(cls, operand_generator, operator_generator,
-                 desired_expression_len, max_attempts):
+                 desired_expression_len, max_attempts, stats=None):
         assert desired_expression_len >= 1, \
             "Bad expression length: %r" % desired_expression_len
+        if stats is None:
+            stats = GenerationStats()
 
         for attempt in range(max_attempts):
+            stats.count('attempts')
+            start = stats.clock()
             sub_expressions = []
             MathExpression.create_random(0, sub_expressions, operand_generator,
                                          operator_generator)
+            sub_expressions_index = ExpressionLengthIndex(sub_expressions)
 
-            expr = cls._find_best_expression_having_certain_len(
-                sub_expressions, desired_expression_len).__str__()
+            expr = sub_expressions_index.find_nearest_len(
+                desired_expression_len)
+            stats.time('random_tree', start)
 
             if (len(expr) < desired_expression_len):
-                expr = cls._lengthen_expression(cls, expr,
-                                                desired_expression_len,
+                stats.count('lengthenings')
+                start = stats.clock()
+                expr = cls._lengthen_expression(expr, desired_expression_len,
                                                 operator_generator,
-                                                sub_expressions)
+                                                sub_expressions_index, stats)
+                stats.time('lengthen', start)
 
-            if (len(expr) > desired_expression_len):
-                expr = cls._shorten_expression(expr.__str__(),
-                                               desired_expression_len)
+            if (len(expr) != desired_expression_len):
+                stats.count('repairs')
+                start = stats.clock()
+                expr = cls._repair_expression(expr, desired_expression_len,
+                                              operand_generator, stats)
+                stats.time('repair', start)
 
             if len(expr) == desired_expression_len:
-                print(expr)
-                break
+                return expr.__str__()
+
+        eprint("Expected ", desired_expression_len, ", got ", len(expr),
+               sep="")
+        return None
+
+
+class ExactLengthExpression(object):
+    """
+    Builds an expression of exactly the desired length in one pass.
+
+    The desired length is a character budget. A node either spends all of it
+    on an operand or splits it into an operator, the brackets the operator
+    forces, and the budgets of its two subexpressions.
+
+    The tree is a random binary tree in which each node is an operator or an
+    operand with even odds, operators and operands are drawn from the
+    generators' distributions, and the whole tree is conditioned on its
+    rendered length. The weights that takes are worked out once, up front,
+    for every length and for each context a subexpression can be rendered
+    in:
+    - as a left operand: the precedence of its parent and whether it starts
+      with '-' once rendered (it inherits that from its own left operand);
+    - as a right operand: the precedence of its parent and whether the
+      parent is a bare + or -, which brackets a right operand starting with
+      '-', as BinaryExpression does.
+    With even odds the tree is a critical branching process, so long
+    expressions still have operand lengths, operators and spacing
+    distributed about as the generators draw them.
+
+    Conditioned on its length alone, such a tree grows about as deep as the
+    square root of its length, deeper than the retry engine's trees, which
+    are at most MathExpression.max_levels deep and lengthened side by side.
+    So each split of two operands' budget is also weighted by how even it
+    is, which keeps the bracket depth of long expressions about the retry
+    engine's.
+    """
+
+    _root_precedence = float('inf')
+    _operator_prob = 0.5
+    # How strongly the budget of two operands is split evenly between them,
+    # fitted so that bracket depth is about the retry engine's.
+    _split_balance = 4.0
+    _split_balance_offset = 16
+
+    def __init__(self, operand_generator, operator_generator,
+                 max_expression_len):
+        super(ExactLengthExpression, self).__init__()
+
+        self._operand_generator = operand_generator
+        self._operators = operator_generator.possible_operators()
+        self._max_expression_len = max_expression_len
+
+        self._compute_weights()
+
+        # Pickers for the choices and the operand splits at each budget and
+        # context, built the first time an expression needs them.
+        self._choice_pickers = {}
+        self._split_pickers = {}
+
+    @staticmethod
+    def _minus_rule(operator):
+        display = operator.display
+        return display == '+' or display == '-'
+
+    def _compute_weights(self):
+        max_len = self._max_expression_len
+        operand_prob = 1.0 - self._operator_prob
+
+        self._operand_weights = {}
+        for negative in (False, True):
+            weights = [0.0] * (max_len + 1)
+            for n, prob in self._operand_generator.len_probabilities(
+                    negative).items():
+                if n <= max_len:
+                    weights[n] = operand_prob * prob
+            self._operand_weights[negative] = weights
+
+        precedences = set(o.prec for o, prob in self._operators)
+        precedences.add(self._root_precedence)
+
+        self._left_weights = {(prec, negative): [0.0] * (max_len + 1)
+                              for prec in precedences
+                              for negative in (False, True)}
+        self._right_weights = {(prec, minus_rule): [0.0] * (max_len + 1)
+                               for prec in precedences
+                               for minus_rule in (False, True)}
+
+        # Weights of the two operands of an operator together, by their
+        # combined length, for each (precedence, left starts with '-',
+        # right follows a bare + or -).
+        self._operands_weights = {
+            (o.prec, negative, self._minus_rule(o)): [0.0] * (max_len + 1)
+            for o, prob in self._operators for negative in (False, True)
+        }
+
+        # An expression is always longer than its operands, so the weights
+        # of each length only depend on those of shorter ones.
+        for n in range(1, max_len + 1):
+            for (prec, negative, minus_rule), weights in \
+                    self._operands_weights.items():
+                left = self._left_weights[(prec, negative)]
+                right = self._right_weights[(prec, minus_rule)]
+                weights[n - 1] = sum(left[a] * right[n - 1 - a]
+                                     for a in range(1, n - 1))
+
+            for (prec, negative), weights in self._left_weights.items():
+                weights[n] = sum(weight for choice, weight
+                                 in self._choices(n, prec, negative, False))
+            for (prec, minus_rule), weights in self._right_weights.items():
+                weights[n] = sum(weight for choice, weight
+                                 in self._choices(n, prec, None, minus_rule))
+
+    def _binary_weight(self, operator, negative, n):
+        key = (operator.prec, negative, self._minus_rule(operator))
+        n -= len(operator.display)
+        return self._operands_weights[key][n] if n >= 0 else 0.0
+
+    def _choices(self, budget, parent_prec, negative, minus_rule):
+        """
+        Lists the ways to fill budget characters, brackets included, with
+        their weights. negative, if not None, is whether the subexpression
+        must start with '-' (left operands); minus_rule is whether it gets
+        bracketed when it starts with '-' (right operands of a bare + or -).
+
+        A choice is (operator, starts with '-', unbracketed length), with
+        operator None for an operand and starts with '-' None for a
+        subexpression bracketed for precedence.
+        """
+        negative_choices = (False, True) if negative is None else (negative,)
+
+        def unbracketed_len(starts_with_minus):
+            return budget - (2 if minus_rule and starts_with_minus else 0)
+
+        choices = []
+        for n in negative_choices:
+            n_len = unbracketed_len(n)
+            if n_len >= 0 and self._operand_weights[n][n_len] > 0:
+                choices.append(((None, n, n_len),
+                                self._operand_weights[n][n_len]))
+
+        for operator, prob in self._operators:
+            operator_weight = self._operator_prob * prob
+            if operator.prec > parent_prec:
+                # Bracketed for precedence, so it starts with a bracket.
+                if negative is not True:
+                    weight = sum(self._binary_weight(operator, n, budget - 2)
+                                 for n in (False, True))
+                    if weight > 0:
+                        choices.append(((operator, None, budget - 2),
+                                        operator_weight * weight))
+            else:
+                for n in negative_choices:
+                    weight = self._binary_weight(operator, n,
+                                                 unbracketed_len(n))
+                    if weight > 0:
+                        choices.append(((operator, n, unbracketed_len(n)),
+                                        operator_weight * weight))
+        return choices
+
+    def can_generate(self, desired_expression_len):
+        if not 1 <= desired_expression_len <= self._max_expression_len:
+            return False
+        root = self._root_precedence
+        return any(self._left_weights[(root, negative)][desired_expression_len]
+                   > 0 for negative in (False, True))
+
+    def generate(self, desired_expression_len):
+        assert desired_expression_len >= 1, \
+            "Bad expression length: %r" % desired_expression_len
+        if not self.can_generate(desired_expression_len):
+            return None
+
+        expr = self._build(desired_expression_len, self._root_precedence,
+                           None, False)
+        assert len(expr) == desired_expression_len
+        return expr.__str__()
+
+    def _build(self, budget, parent_prec, negative, minus_rule):
+        key = (budget, parent_prec, negative, minus_rule)
+        choice_picker = self._choice_pickers.get(key)
+        if choice_picker is None:
+            choices = self._choices(budget, parent_prec, negative, minus_rule)
+            assert choices, "Cannot build %r characters" % budget
+            choice_picker = WeightedRandomPicker.from_weights(*zip(*choices))
+            self._choice_pickers[key] = choice_picker
+        operator, starts_with_minus, unbracketed_len = choice_picker.pick()
+
+        if operator is None:
+            return self._operand_generator.randomly_generate_with_len(
+                unbracketed_len, starts_with_minus)
+
+        prec = operator.prec
+        minus_rule = self._minus_rule(operator)
+        operands_len = unbracketed_len - len(operator.display)
+
+        key = (operands_len, prec, starts_with_minus, minus_rule)
+        split_picker = self._split_pickers.get(key)
+        if split_picker is None:
+            split_picker = self._get_split_picker(*key)
+            self._split_pickers[key] = split_picker
+        left_negative, left_len = split_picker.pick()
+
+        left = self._build(left_len, prec, left_negative, False)
+        right = self._build(operands_len - left_len, prec, None, minus_rule)
+        return BinaryExpression(operator, left, right)
+
+    @classmethod
+    def _balance(cls, left_len, right_len):
+        """
+        Returns the weight of splitting a budget into left_len and right_len:
+        1 for an even split, less the more uneven it is. The offset spares
+        splits that leave one side short, so that operand lengths stay close
+        to how they are drawn.
+        """
+        left_len += cls._split_balance_offset
+        right_len += cls._split_balance_offset
+        return (4.0 * left_len * right_len
+                / (left_len + right_len) ** 2) ** cls._split_balance
+
+    def _get_split_picker(self, operands_len, prec, starts_with_minus,
+                          minus_rule):
+        if starts_with_minus is None:
+            left_negative_choices = (False, True)
+        else:
+            left_negative_choices = (starts_with_minus,)
+        right_weights = self._right_weights[(prec, minus_rule)]
+
+        splits = []
+        for n in left_negative_choices:
+            left_weights = self._left_weights[(prec, n)]
+            for left_len in range(1, operands_len):
+                right_len = operands_len - left_len
+                weight = (left_weights[left_len] * right_weights[right_len]
+                          * self._balance(left_len, right_len))
+                if weight > 0:
+                    splits.append(((n, left_len), weight))
+        return WeightedRandomPicker.from_weights(*zip(*splits))
+
+
+class GenerationStats(object):
+    """
+    Counts the attempts it took to generate expressions. If by_len is true,
+    it also counts, for each expression length, what the attempts did and
+    how many seconds each of their phases took.
+
+    Counts are kept in Counters, in total and by length, under these names:
+    expressions, failures, attempts, lengthenings (calls to
+    _lengthen_expression), lengthening_operators (operators and
+    subexpressions it joined), repairs (calls to _repair_expression),
+    repair_edits, and the seconds of each phase: exact_seconds,
+    random_tree_seconds, lengthen_seconds, repair_seconds and
+    total_seconds.
+    """
+
+    def __init__(self, by_len=False):
+        super(GenerationStats, self).__init__()
+        self.by_len = by_len
+        self.reset()
+
+    def reset(self):
+        self.totals = Counter()
+        self.lens = {}
+        self._len_counts = Counter()
+
+    @property
+    def attempts(self):
+        return self.totals['attempts']
+
+    @property
+    def expressions(self):
+        return self.totals['expressions']
+
+    @property
+    def failures(self):
+        return self.totals['failures']
+
+    def attempts_per_expression(self):
+        if self.expressions == 0:
+            return None
+        return self.attempts / self.expressions
+
+    def start(self, expression_len):
+        """
+        Counts what follows for expression_len.
+        """
+        if self.by_len:
+            self._len_counts = self.lens.setdefault(expression_len, Counter())
+
+    def count(self, name, n=1):
+        self.totals[name] += n
+        if self.by_len:
+            self._len_counts[name] += n
+
+    def clock(self):
+        """
+        Returns the start time of a phase, to give to time().
+        """
+        return time.perf_counter() if self.by_len else 0.0
+
+    def time(self, phase, start):
+        if self.by_len:
+            self.count(phase + '_seconds', time.perf_counter() - start)
+
+    def as_dict(self):
+        return {
+            'total': dict(self.totals),
+            'lengths': {n: dict(counts)
+                        for n, counts in sorted(self.lens.items())}
+        }
+
+    def merge(self, stats_dict):
+        """
+        Adds the counts of another GenerationStats, given as_dict().
+        """
+        self.totals.update(stats_dict['total'])
+        for n, counts in stats_dict['lengths'].items():
+            self.lens.setdefault(n, Counter()).update(counts)
+
+
+class ExpressionGenerator(object):
+    """
+    Generates expressions of a given length for one operator and number
+    profile, using the requested engine.
+
+    Generators of several profiles can share an operand_pool and, through
+    operand_generators, a dict, the operand generators and the samplers
+    they have warmed up for profiles with the same operands.
+    """
+
+    max_attempts = 100
+
+    def __init__(self, operators, integer_len, float_len,
+                 number_of_spaces_around_operator, max_expression_len,
+                 engine, operand_pool=None, operand_generators=None,
+                 stats_by_len=False):
+        super(ExpressionGenerator, self).__init__()
+
+        if operand_pool is None:
+            operand_pool = OperandPool()
+        if operand_generators is None:
+            operand_generators = {}
+        self._operand_pool = operand_pool
+        self.stats = GenerationStats(stats_by_len)
+
+        self._operator_generator = OperatorGenerator.get(
+            operators, number_of_spaces_around_operator)
+
+        key = (integer_len, float_len,
+               OperandGenerator.avoid_many_zeroes(integer_len, operators))
+        self._operand_generator = operand_generators.get(key)
+        if self._operand_generator is None:
+            self._operand_generator = OperandGenerator.get(
+                operators, integer_len, float_len, operand_pool)
+            operand_generators[key] = self._operand_generator
+
+        self._exact_length_expression = None
+        if engine == 'exact':
+            self._exact_length_expression = ExactLengthExpression(
+                self._operand_generator, self._operator_generator,
+                max_expression_len)
+
+    @classmethod
+    def from_params(cls, params, operand_pool=None, operand_generators=None):
+        return cls(params['operators'], params['integer_len'],
+                   params['float_len'],
+                   params['number_of_spaces_around_operator'],
+                   params['max_expression_len'], params['engine'],
+                   operand_pool, operand_generators,
+                   params.get('stats_filename') is not None)
+
+    def generate(self, desired_expression_len):
+        """
+        Returns an expression of the desired length, or None if none could
+        be generated.
+        """
+        stats = self.stats
+        stats.start(desired_expression_len)
+        generate_start = stats.clock()
+
+        expr = None
+        if self._exact_length_expression is not None:
+            start = stats.clock()
+            expr = self._exact_length_expression.generate(
+                desired_expression_len)
+            stats.time('exact', start)
+            if expr is not None:
+                stats.count('attempts')
+        if expr is None:
+            expr = Expression.generate(self._operand_generator,
+                                       self._operator_generator,
+                                       desired_expression_len,
+                                       self.max_attempts, stats)
+        if expr is None:
+            stats.count('failures')
+        else:
+            stats.count('expressions')
 
-        if len(expr) != desired_expression_len:
-            eprint("Expected ", desired_expression_len, ", got ", len(expr),
-                   sep="")
+        stats.time('total', generate_start)
+        return expr
+
+    def generate_block(self, seed, expression_len, block, count):
+        """
+        Returns the expressions of one block (see expression_blocks) of the
+        given length. Lengths that cannot be generated are left out.
+        """
+        random.seed(seed_for_len(seed, expression_len, block))
+        self._operand_pool.reset(count)
+        expressions = []
+        for i in range(count):
+            expr = self.generate(expression_len)
+            if expr is not None:
+                expressions.append(expr)
+        return expressions
+
+
+def seed_for_len(seed, expression_len, block=0):
+    """
+    Derives the seed for a block of expressions of one length from the seed
+    of the run, so that each block comes out the same whichever process
+    generates it.
+    """
+    if block == 0:
+        return "%s-%d" % (seed, expression_len)
+    return "%s-%d-%d" % (seed, expression_len, block)
+
+
+# Expressions of a length are generated, seeded and written out in blocks of
+# this many, so that memory stays bounded however many there are.
+expressions_per_block = 1000
+
+
+def expression_blocks(seed, lengths, count):
+    """
+    Lazily splits count expressions of each length into blocks, returned as
+    (seed, expression_len, block, number of expressions) tuples.
+    """
+    for expression_len in lengths:
+        for block, first in enumerate(range(0, count, expressions_per_block)):
+            yield (seed, expression_len, block,
+                   min(expressions_per_block, count - first))
+
+
+def iter_expressions(profile, lengths, count=1, seed=None):
+    """
+    Yields count expressions of each of the given lengths, in length order,
+    generated by profile, an ExpressionGenerator. No more than one block of
+    expressions is held in memory at a time.
+
+    The same seed gives the same expressions as the command line does with
+    --seed.
+    """
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+    for block in expression_blocks(seed, lengths, count):
+        for expr in profile.generate_block(*block):
+            yield expr
+
+
+# Operators and number types of the profiles generated by --all, as given
+# to --operators, and --integer and --float.
+all_profiles_operators = ['a', 's', 'm', 'd', 'as', 'md', 'asmd']
+all_profiles_number_types = ['i', 'f', 'if']
+
+
+def all_profiles(params):
+    """
+    Returns the params of each profile generated by --all, by profile name,
+    e.g. 'md-if99' for multiplication and division of random length
+    integers and floats.
+    """
+    profiles = {}
+    for operators in all_profiles_operators:
+        for number_type in all_profiles_number_types:
+            profile_params = dict(params)
+            profile_params['operators'] = operators_by_option[operators]
+            profile_params['integer_len'] = 99 if 'i' in number_type else None
+            profile_params['float_len'] = 99 if 'f' in number_type else None
+            profiles['%s-%s99' % (operators, number_type)] = profile_params
+    return profiles
+
+
+def profile_blocks(seed, profile_names, lengths, count):
+    """
+    Lazily splits the expressions of each profile into blocks, returned as
+    (profile name, block) tuples (see expression_blocks). A profile named
+    None is seeded with the seed of the run, any other with a seed derived
+    from it and its name.
+    """
+    for name in profile_names:
+        profile_seed = seed if name is None else "%d-%s" % (seed, name)
+        for block in expression_blocks(profile_seed, lengths, count):
+            yield name, block
+
+
+def build_expression_generators(profiles):
+    """
+    Builds the ExpressionGenerator of each profile, all sharing an operand
+    pool and operand generators.
+    """
+    operand_pool = OperandPool()
+    operand_generators = {}
+    return {name: ExpressionGenerator.from_params(params, operand_pool,
+                                                  operand_generators)
+            for name, params in profiles.items()}
+
+
+# Expression generators of a --jobs worker process, by profile name.
+_worker_expression_generators = None
+
+
+def init_worker(profiles):
+    # Forked workers inherit the generators the parent process already built.
+    global _worker_expression_generators
+    if _worker_expression_generators is None:
+        _worker_expression_generators = build_expression_generators(profiles)
+
+
+def generate_expression_block(profile_block):
+    """
+    Returns the profile name, the expressions, the messages and the
+    GenerationStats.as_dict() of one (profile name, block) tuple, stats None
+    unless --stats is on.
+    """
+    name, block = profile_block
+    generator = _worker_expression_generators[name]
+    generator.stats.reset()
+    with contextlib.redirect_stderr(io.StringIO()) as messages:
+        expressions = generator.generate_block(*block)
+    stats = generator.stats.as_dict() if generator.stats.by_len else None
+    return name, expressions, messages.getvalue(), stats
+
+
+def imap_bounded(pool, func, iterable, max_pending):
+    """
+    Like pool.imap, but never runs ahead of the caller by more than
+    max_pending results, so that results waiting to be consumed cannot pile
+    up in memory.
+    """
+    pending = deque()
+    for item in iterable:
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def write_expressions(blocks, output_files, message_files, profile_stats):
+    """
+    Writes the expressions and messages of each block returned by
+    generate_expression_block to the files of its profile, and adds up its
+    stats in the GenerationStats of its profile in profile_stats.
+    """
+    for name, expressions, messages, stats in blocks:
+        if expressions:
+            output_files[name].write("\n".join(expressions) + "\n")
+        if messages:
+            message_files[name].write(messages)
+        if stats is not None:
+            profile_stats[name].merge(stats)
+
+
+def write_stats(profile_stats, filename):
+    """
+    Writes the stats of each profile as JSON to filename, or to stderr if
+    filename is '-'. The stats of the single profile of a run without --all
+    are written on their own; those of --all by profile name under
+    "profiles".
+    """
+    if None in profile_stats:
+        report = profile_stats[None].as_dict()
+    else:
+        report = {'profiles': {name: stats.as_dict()
+                               for name, stats in profile_stats.items()}}
+
+    if filename == '-':
+        json.dump(report, sys.stderr, indent=1, sort_keys=True)
+        sys.stderr.write("\n")
+    else:
+        with open(filename, 'w') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+            f.write("\n")
 
 
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
-def enclose_expression_in_brackets(expr):
+_parentheses = ('(', ')')
+_square_brackets = ('[', ']')
+
+
+def randomly_pick_brackets():
     use_parenthesis = random.random() <= 0.5
-    left_bracket = '(' if use_parenthesis else '['
-    right_bracket = ')' if use_parenthesis else ']'
-    return left_bracket + expr + right_bracket
+    return _parentheses if use_parenthesis else _square_brackets
 
 
 def show_help_and_exit(default_max_expression_len,
@@ -536,15 +1554,15 @@ def show_help_and_exit(default_max_expression_len,
     print("-i, --integer nn")
     print("  Generates random integers of length nn.")
     print("  nn: {}-{}, 99=random length. Default: 99".format(
-            min(GenerateInteger().integer_len_range),
-            max(GenerateInteger().integer_len_range)
+            min(GenerateInteger.integer_len_range),
+            max(GenerateInteger.integer_len_range)
         )
     )
     print("-f, --float nn")
     print("  Generates random floats of length nn.")
     print("  nn: {}-{}, 99=random length. Default: 99".format(
-            min(GenerateFloat().float_len_range),
-            max(GenerateFloat().float_len_range)
+            min(GenerateFloat.float_len_range),
+            max(GenerateFloat.float_len_range)
         )
     )
     print("-o, --operators a|s|m|d|as|md|asmd")
@@ -562,6 +1580,28 @@ def show_help_and_exit(default_max_expression_len,
     print("-l, --length nnn")
     print("  Generates expressions of length 1 to nnn. Default:",
           default_max_expression_len)
+    print("-e, --engine exact|retry")
+    print("  exact: builds each expression to its exact length (default)")
+    print("  retry: builds random expressions, then lengthens or edits")
+    print("         them, up to 100 attempts per length")
+    print("  Lengths exact cannot build fall back to retry.")
+    print("-c, --count n")
+    print("  Generates n expressions of each length. Default: 1")
+    print("-j, --jobs n")
+    print("  Number of processes generating expressions. Default: 1")
+    print("--seed n")
+    print("  Seeds the random number generator. Runs with the same seed and")
+    print("  options generate the same expressions, whatever the number of")
+    print("  jobs. Default: random seed.")
+    print("--stats filename")
+    print("  Writes, as JSON, how many attempts each length took, what they")
+    print("  did and how long their phases took, by length and in total, to")
+    print("  filename, or to stderr if filename is -.")
+    print("-a, --all dir")
+    print("  Generates the expressions of every operator set of -o with")
+    print("  -i 99, -f 99 and -i 99 -f 99 in one run, into files")
+    print("  dir/{a,s,m,d,as,md,asmd}-{i,f,if}99-expr. Messages go to the")
+    print("  files' .err instead of -expr. -i, -f and -o are ignored.")
     print("-h, --help")
     print("  Displays this help screen.")
     sys.exit(1)
@@ -579,11 +1619,18 @@ def parse_cmd_line_options(argv):
     number_of_spaces_around_operator = None
     max_expression_len = 511
     max_number_of_spaces_around_operator = 9
+    engine = 'exact'
+    count = 1
+    jobs = 1
+    seed = None
+    all_profiles_dir = None
+    stats_filename = None
 
     try:
-        opts, args = getopt.getopt(argv, "i:f:l:s:o:h", ["integer=", "float=",
-                                                         "length=", "space=",
-                                                         "operators=", "help"])
+        opts, args = getopt.getopt(argv, "i:f:l:s:o:e:c:j:a:h",
+                                   ["integer=", "float=", "length=", "space=",
+                                    "operators=", "engine=", "count=", "jobs=",
+                                    "seed=", "all=", "stats=", "help"])
     except getopt.GetoptError:
         show_invalid_syntax_and_exit()
     for opt,arg in opts:
@@ -607,22 +1654,31 @@ def parse_cmd_line_options(argv):
                 > max_number_of_spaces_around_operator):
                 show_invalid_syntax_and_exit()
         elif opt in ("-o", "--operators"):
-            if arg == 'a':
-                operators = Operators.ADDITION
-            elif arg == 's':
-                operators = Operators.SUBTRACTION
-            elif arg == 'm':
-                operators = Operators.MULTIPLICATION
-            elif arg == 'd':
-                operators = Operators.DIVISION
-            elif arg == 'as':
-                operators = Operators.ADDITION_SUBTRACTION
-            elif arg == 'md':
-                operators = Operators.MULTIPLICATION_DIVISION
-            elif arg == 'asmd':
-                operators = Operators.ADDITION_SUBTRACTION_MULTIPLICATION_DIVISION
-            else:
+            if arg not in operators_by_option:
+                show_invalid_syntax_and_exit()
+            operators = operators_by_option[arg]
+        elif opt in ("-e", "--engine"):
+            if arg not in ('exact', 'retry'):
+                show_invalid_syntax_and_exit()
+            engine = arg
+        elif opt in ("-c", "--count"):
+            if arg is None or not arg.isdigit():
                 show_invalid_syntax_and_exit()
+            count = int(arg)
+        elif opt in ("-j", "--jobs"):
+            if arg is None or not arg.isdigit() or int(arg) < 1:
+                show_invalid_syntax_and_exit()
+            jobs = int(arg)
+        elif opt == "--seed":
+            if arg is None or not arg.isdigit():
+                show_invalid_syntax_and_exit()
+            seed = int(arg)
+        elif opt in ("-a", "--all"):
+            if not os.path.isdir(arg):
+                show_invalid_syntax_and_exit()
+            all_profiles_dir = arg
+        elif opt == "--stats":
+            stats_filename = arg
         elif opt in ("-h", "--help"):
             show_help_and_exit(max_expression_len,
                                max_number_of_spaces_around_operator)
@@ -632,38 +1688,61 @@ def parse_cmd_line_options(argv):
         'float_len': float_len,
         'operators': operators,
         'number_of_spaces_around_operator': number_of_spaces_around_operator,
-        'max_expression_len': max_expression_len
+        'max_expression_len': max_expression_len,
+        'engine': engine,
+        'count': count,
+        'jobs': jobs,
+        'seed': seed,
+        'all_profiles_dir': all_profiles_dir,
+        'stats_filename': stats_filename
     }
 
 
 def main():
-    random.seed()
-
     params = parse_cmd_line_options(sys.argv[1:])
 
-    operator_generator = OperatorGenerator.get(params['operators'],
-         params['number_of_spaces_around_operator'])
-
-    if (params['integer_len'] is not None and
-            params['float_len'] is None):
-        operand_generator = OperandGenerator.get_integer_generator(
-            params['integer_len'], params['operators'])
-    elif (params['integer_len'] is None
-            and params['float_len'] is not None):
-        operand_generator = OperandGenerator.get_float_generator(
-            params['float_len']
-        )
+    seed = params['seed']
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+
+    output_files = {}
+    message_files = {}
+    if params['all_profiles_dir'] is None:
+        profiles = {None: params}
+        output_files[None] = sys.stdout
+        message_files[None] = sys.stderr
     else:
-        operand_generator = OperandGenerator.get_integer_and_float_generator(
-            params['operators'], params['integer_len'],
-            params['float_len']
-        )
+        profiles = all_profiles(params)
+        for name in profiles:
+            path = os.path.join(params['all_profiles_dir'], name)
+            output_files[name] = open(path + '-expr', 'w')
+            message_files[name] = open(path + '.err', 'w')
+
+    profile_stats = {name: GenerationStats(True) for name in profiles}
+
+    lengths = range(1, params['max_expression_len'] + 1)
+    blocks = profile_blocks(seed, profiles, lengths, params['count'])
+
+    init_worker(profiles)
+
+    if params['jobs'] > 1:
+        with multiprocessing.Pool(params['jobs'], init_worker,
+                                  (profiles,)) as pool:
+            # Blocks come back in order, so expressions stay in length order.
+            write_expressions(
+                imap_bounded(pool, generate_expression_block, blocks,
+                             2 * params['jobs']),
+                output_files, message_files, profile_stats)
+    else:
+        write_expressions(map(generate_expression_block, blocks),
+                          output_files, message_files, profile_stats)
+
+    if params['stats_filename'] is not None:
+        write_stats(profile_stats, params['stats_filename'])
 
-    for expr_len in range(params['max_expression_len']):
-        desired_expression_len = expr_len + 1
-        max_attempts = 100
-        Expression.generate(operand_generator, operator_generator,
-                            desired_expression_len, max_attempts)
+    if params['all_profiles_dir'] is not None:
+        for f in list(output_files.values()) + list(message_files.values()):
+            f.close()
 
     sys.exit(0)
 
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+
+"""
+This Python script generates random elementary math expressions and turns
+them into test cases for clc in one run, without writing expression files
+in between: it does the work of batch-generate-random-elementary-arithmetic-
+expressions.sh and batch-create-test-cases-from-generated-expressions.sh.
+
+Three stages run at the same time, connected by bounded queues:
+- generating expressions, with the generator classes of generate-random-
+  elementary-arithmetic-expressions.py;
+- evaluating them with clc -b and working out the expected answers, as
+  create-test-cases-from-generated-expressions.py does;
+- writing the test functions.
+So test cases are written while expressions are still being generated, and
+no stage runs more than a few chunks ahead of the next.
+
+The test function of each profile is written to output_dir/<profile>-
+expr.tests (e.g. md-if99-expr.tests), as the batch scripts write it, ready
+for combine-test-cases.sh. Runs with the same seed write the same test cases as
+the batch scripts do from expressions generated with that seed.
+
+Syntax: ./generate-test-cases.py [options] output_dir
+
+Type -h or --help to see program options.
+
+Exit code:
+0 = Test cases generated.
+1 = Command line options displayed.
+2 = Invalid program option specified.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import getopt
+import importlib.util
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import threading
+
+
+def load_module(name, filename):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so that functions of the module can be pickled for --jobs
+    # worker processes.
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+gen = load_module('expression_generator',
+                  'generate-random-elementary-arithmetic-expressions.py')
+ctc = load_module('test_case_creator',
+                  'create-test-cases-from-generated-expressions.py')
+
+# Expressions of a profile are evaluated and written in chunks of up to this
+# many, and each queue holds this many chunks at most.
+expressions_per_chunk = 100
+max_queued_chunks = 4
+
+# Marks the end of a queue, or, as an exception, the failure of a stage.
+end_of_stage = None
+
+
+def main():
+    params = parse_cmd_line_options(sys.argv[1:])
+
+    seed = params['seed']
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(64)
+
+    profiles = gen.all_profiles(params)
+    if params['profile_names'] is not None:
+        profiles = {name: profiles[name] for name in params['profile_names']}
+
+    if params['cache_filename'] is not None and params['oracle'] == 'calc':
+        ctc.answer_cache = ctc.AnswerCache(params['cache_filename'],
+                                           ctc.get_calc_version(),
+                                           params['cache_size'])
+
+    lengths = range(1, params['max_expression_len'] + 1)
+    blocks = gen.profile_blocks(seed, profiles, lengths, params['count'])
+
+    gen.init_worker(profiles)
+    # Worker processes are forked before any thread is started.
+    pool = (multiprocessing.Pool(params['jobs'], gen.init_worker, (profiles,))
+            if params['jobs'] > 1 else None)
+
+    try:
+        run_pipeline(blocks, pool, params)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if ctc.answer_cache is not None:
+            ctc.answer_cache.close()
+            print("Answer cache:", ctc.answer_cache.hits, "hits,",
+                  ctc.answer_cache.misses, "misses", file=sys.stderr)
+        ctc.calc_session.close()
+
+    sys.exit(0)
+
+
+def run_pipeline(blocks, pool, params):
+    expression_queue = queue.Queue(max_queued_chunks)
+    answer_queue = queue.Queue(max_queued_chunks)
+
+    stages = [
+        threading.Thread(target=run_stage, args=(
+            lambda: generate_chunks(blocks, pool, params['jobs']),
+            expression_queue)),
+        threading.Thread(target=run_stage, args=(
+            lambda: evaluate_chunks(queue_items(expression_queue),
+                                    params['oracle'], params['jobs']),
+            answer_queue))
+    ]
+    for stage in stages:
+        stage.daemon = True
+        stage.start()
+
+    write_test_functions(queue_items(answer_queue), params['output_dir'],
+                         params['verbose'])
+
+    for stage in stages:
+        stage.join()
+
+
+def run_stage(stage, output_queue):
+    """
+    Puts what stage() yields into output_queue, followed by end_of_stage. If
+    the stage fails, the exception is put in the queue instead, to be raised
+    by whoever reads it.
+    """
+    try:
+        for item in stage():
+            output_queue.put(item)
+        output_queue.put(end_of_stage)
+    except BaseException as e:
+        output_queue.put(e)
+
+
+def queue_items(q):
+    while True:
+        item = q.get()
+        if item is end_of_stage:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+def generate_chunks(blocks, pool, jobs):
+    """
+    Yields (profile name, expressions) chunks of the expressions generated,
+    in order. A chunk holds expressions of one profile only.
+    """
+    if pool is not None:
+        generated_blocks = gen.imap_bounded(pool, gen.generate_expression_block,
+                                            blocks, 2 * jobs)
+    else:
+        generated_blocks = map(gen.generate_expression_block, blocks)
+
+    chunk_name = None
+    chunk = []
+    for name, expressions, messages, stats in generated_blocks:
+        if messages:
+            sys.stderr.write(messages)
+        if name != chunk_name and chunk:
+            yield chunk_name, chunk
+            chunk = []
+        chunk_name = name
+        for expr in expressions:
+            chunk.append(expr)
+            if len(chunk) == expressions_per_chunk:
+                yield chunk_name, chunk
+                chunk = []
+    if chunk:
+        yield chunk_name, chunk
+
+
+def evaluate_chunks(chunks, oracle, jobs):
+    """
+    Yields (profile name, expressions, answers) for each chunk, an answer
+    being the (clc answer, exit code, full answer key, answer key,
+    approximated) of an expression.
+    """
+    executor = ThreadPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        for name, expressions in chunks:
+            answers = list(ctc.evaluate_expressions(expressions, oracle,
+                                                    executor))
+            yield name, expressions, answers
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def write_test_functions(chunks, output_dir, verbose):
+    """
+    Writes the test function of each profile from its answered chunks. A
+    chunk is held back until the next one arrives, as the last test case of
+    a function is written differently.
+    """
+    script_file = None
+    held_chunk = None
+    counts = None
+
+    for chunk in chunks:
+        if held_chunk is not None:
+            counts = write_chunk(script_file, held_chunk, counts, verbose,
+                                 chunk[0] != held_chunk[0])
+            if chunk[0] != held_chunk[0]:
+                finish_test_function(script_file, held_chunk[0], counts)
+                script_file = None
+        if script_file is None:
+            script_file = start_test_function(output_dir, chunk[0])
+            counts = (0, 0)
+        held_chunk = chunk
+
+    if held_chunk is not None:
+        counts = write_chunk(script_file, held_chunk, counts, verbose, True)
+        finish_test_function(script_file, held_chunk[0], counts)
+
+
+def start_test_function(output_dir, profile_name):
+    filename = os.path.join(output_dir, profile_name + '-expr.tests')
+    basename = os.path.splitext(os.path.basename(filename))[0]
+    script_file = open(filename, 'w')
+    script_file.write(ctc.generate_function_name(basename) + "()\n")
+    script_file.write("{\n")
+    return script_file
+
+
+def write_chunk(script_file, chunk, counts, verbose, last_chunk):
+    """
+    Writes the test cases of chunk and returns the counts of expressions and
+    of expressions commented out so far, updated.
+    """
+    name, expressions, answers = chunk
+    commented_out_count = ctc.write_out_test_cases(
+        script_file, expressions, iter(answers), verbose, last_chunk)
+    script_file.flush()
+    return counts[0] + len(expressions), counts[1] + commented_out_count
+
+
+def finish_test_function(script_file, profile_name, counts):
+    script_file.write("}\n")
+    script_file.close()
+
+    total_expr_count, tossed_out_count = counts
+    print(profile_name + "-expr:", total_expr_count - tossed_out_count,
+          "test expressions", "+", tossed_out_count,
+          "expressions commented out", "=", total_expr_count,
+          "expressions total")
+    sys.stdout.flush()
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def show_help_and_exit():
+    print("Generates random elementary math expressions and their test cases")
+    print("for clc in one run.")
+    print()
+    print("Options:")
+    print("-p, --profiles name,...")
+    print("  Profiles to generate, e.g. a-i99,md-if99. Default: all of")
+    print("  {a,s,m,d,as,md,asmd}-{i,f,if}99")
+    print("-l, --length nnn")
+    print("  Generates expressions of length 1 to nnn. Default: 511")
+    print("-c, --count n")
+    print("  Generates n expressions of each length. Default: 1")
+    print("-e, --engine exact|retry")
+    print("  As for generate-random-elementary-arithmetic-expressions.py.")
+    print("  Default: exact")
+    print("--seed n")
+    print("  Seeds the random number generator. Default: random seed.")
+    print("-j, --jobs n")
+    print("  Number of processes generating expressions, and of jobs working")
+    print("  out expected answers. Default: 1")
+    print("--oracle calc|exact")
+    print("--cache filename")
+    print("--cache-size n")
+    print("-v, --verbose")
+    print("  As for create-test-cases-from-generated-expressions.py.")
+    print("-h, --help")
+    print("  Displays this help screen.")
+    sys.exit(1)
+
+
+def show_invalid_syntax_and_exit():
+    eprint('Invalid syntax. Enter -h for help.')
+    sys.exit(2)
+
+
+def parse_cmd_line_options(argv):
+    profile_names = None
+    max_expression_len = 511
+    count = 1
+    engine = 'exact'
+    seed = None
+    jobs = 1
+    oracle = 'calc'
+    cache_filename = None
+    cache_size = ctc.AnswerCache.default_max_size
+    verbose = False
+
+    try:
+        opts, args = getopt.getopt(argv, "p:l:c:e:j:vh",
+                                   ["profiles=", "length=", "count=",
+                                    "engine=", "seed=", "jobs=", "oracle=",
+                                    "cache=", "cache-size=", "verbose",
+                                    "help"])
+    except getopt.GetoptError:
+        show_invalid_syntax_and_exit()
+    for opt, arg in opts:
+        if opt in ("-p", "--profiles"):
+            profile_names = arg.split(',')
+            known_profiles = gen.all_profiles({})
+            if not all(name in known_profiles for name in profile_names):
+                show_invalid_syntax_and_exit()
+        elif opt in ("-l", "--length"):
+            if not arg.isdigit() or int(arg) < 1:
+                show_invalid_syntax_and_exit()
+            max_expression_len = int(arg)
+        elif opt in ("-c", "--count"):
+            if not arg.isdigit():
+                show_invalid_syntax_and_exit()
+            count = int(arg)
+        elif opt in ("-e", "--engine"):
+            if arg not in ('exact', 'retry'):
+                show_invalid_syntax_and_exit()
+            engine = arg
+        elif opt == "--seed":
+            if not arg.isdigit():
+                show_invalid_syntax_and_exit()
+            seed = int(arg)
+        elif opt in ("-j", "--jobs"):
+            if not arg.isdigit() or int(arg) < 1:
+                show_invalid_syntax_and_exit()
+            jobs = int(arg)
+        elif opt == "--oracle":
+            if arg not in ('calc', 'exact'):
+                show_invalid_syntax_and_exit()
+            oracle = arg
+        elif opt == "--cache":
+            cache_filename = arg
+        elif opt == "--cache-size":
+            if not arg.isdigit():
+                show_invalid_syntax_and_exit()
+            cache_size = int(arg)
+        elif opt in ("-v", "--verbose"):
+            verbose = True
+        elif opt in ("-h", "--help"):
+            show_help_and_exit()
+    if len(args) != 1 or not os.path.isdir(args[0]):
+        show_invalid_syntax_and_exit()
+
+    return {
+        'profile_names': profile_names,
+        'integer_len': None,
+        'float_len': None,
+        'number_of_spaces_around_operator': None,
+        'max_expression_len': max_expression_len,
+        'engine': engine,
+        'count': count,
+        'seed': seed,
+        'jobs': jobs,
+        'oracle': oracle,
+        'cache_filename': cache_filename,
+        'cache_size': cache_size,
+        'verbose': verbose,
+        'output_dir': args[0]
+    }
+
+
+if __name__ == "__main__":
+    main()
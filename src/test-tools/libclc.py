@@ -0,0 +1,103 @@
+"""
+ctypes binding of libclc.so, clc's evaluator built as a shared library by
+make lib, for the test tools to evaluate expressions in-process instead of
+running clc for them:
+
+    with libclc.Clc() as clc:
+        clc.calculate('1 + 14 / 4')          # ('4.5\n', 0)
+        clc.calculate_many(expressions)
+
+calculate() returns exactly what clc prints for an expression, newline
+included, and the exit code it exits with, as if the expression were the
+one argument of clc. Options, such as -p, are not recognized.
+calculate_many() does the same for a list of expressions in one call of
+clc_calculate_many(), instead of one call into the library per expression.
+
+A Clc holds an evaluation context of its own; use one per thread.
+"""
+
+import ctypes
+import os
+
+
+default_library_filename = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), '..', 'libclc.so')
+
+output_buf_size = 128
+
+# clc_error
+ok = 0
+output_buffer_too_small = 4
+
+
+class Clc():
+    def __init__(self, library_filename=default_library_filename):
+        super(Clc, self).__init__()
+        self._lib = ctypes.CDLL(library_filename)
+        self._lib.clc_create_context.restype = ctypes.c_void_p
+        self._lib.clc_create_context.argtypes = []
+        self._lib.clc_destroy_context.restype = None
+        self._lib.clc_destroy_context.argtypes = [ctypes.c_void_p]
+        self._lib.clc_calculate.restype = ctypes.c_int
+        self._lib.clc_calculate.argtypes = [ctypes.c_void_p, ctypes.c_char_p,
+                                            ctypes.c_char_p, ctypes.c_int]
+        self._lib.clc_calculate_many.restype = ctypes.c_int
+        self._lib.clc_calculate_many.argtypes = [
+            ctypes.c_void_p, ctypes.POINTER(ctypes.c_char_p), ctypes.c_int,
+            ctypes.c_char_p, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+        self._lib.clc_error_message.restype = ctypes.c_char_p
+        self._lib.clc_error_message.argtypes = [ctypes.c_void_p]
+
+        self._context = self._lib.clc_create_context()
+        if self._context is None:
+            raise MemoryError("clc_create_context")
+        self._output = ctypes.create_string_buffer(output_buf_size)
+
+    def calculate(self, expression):
+        """
+        Returns (what clc prints, exit code) for expression.
+        """
+        error = self._lib.clc_calculate(self._context, expression.encode(),
+                                        self._output, output_buf_size)
+        if error == output_buffer_too_small:
+            output = self._lib.clc_error_message(self._context) + b'\n'
+        else:
+            output = self._output.value
+        return output.decode(), 0 if error == ok else 1
+
+    def calculate_many(self, expressions):
+        """
+        Returns (what clc prints, exit code) for each of the expressions.
+        """
+        count = len(expressions)
+        if count == 0:
+            return []
+        encoded = (ctypes.c_char_p * count)(
+            *[expression.encode() for expression in expressions])
+        outputs = ctypes.create_string_buffer(count * output_buf_size)
+        errors = (ctypes.c_int * count)()
+        self._lib.clc_calculate_many(self._context, encoded, count, outputs,
+                                     output_buf_size, errors)
+
+        results = []
+        raw = outputs.raw
+        for i, error in enumerate(errors):
+            if error == output_buffer_too_small:
+                # The message is the context's, left by a later expression.
+                results.append(self.calculate(expressions[i]))
+                continue
+            start = i * output_buf_size
+            output = raw[start:raw.index(b'\0', start)]
+            results.append((output.decode(), 0 if error == ok else 1))
+        return results
+
+    def close(self):
+        if self._context is not None:
+            self._lib.clc_destroy_context(self._context)
+            self._context = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -9,26 +9,41 @@ The files will be created in the same directory as the shell script.
 The generated expression test cases are expected to be inside the function
 run_generated_expression_test_cases.
 
+The shell script is read through once to index the byte offsets of its
+functions. The index is saved next to it, in a file ending in .index, and
+reused until the shell script changes. The functions are then read straight
+from their offsets.
+
 Syntax: ./recreate-expressions-and-test-cases.py shell_script
         shell_script is either tests-long-double.sh or tests-double.sh
 """
 
+import json
+import mmap
 import re
 import os
 import sys
 
 
+function_regex = re.compile(rb"^[a-zA-z_][a-zA-Z_0-9]*\(\)$")
+expression_regex = re.compile('"(.*)"')
+
+
 def main():
     test_script_filename = get_test_script_filename_from_command_line()
     test_script_path = os.path.dirname(test_script_filename)
 
-    lines = read_in_all_lines(test_script_filename)
+    functions_dict = get_function_index(test_script_filename)
 
-    functions_dict = find_all_functions(lines)
-    gen_expr_functions = get_gen_expr_functions(functions_dict, lines)
+    with open(test_script_filename, 'rb') as test_script_file, \
+            mmap.mmap(test_script_file.fileno(), 0,
+                      access=mmap.ACCESS_READ) as test_script:
+        gen_expr_functions = get_gen_expr_functions(functions_dict,
+                                                    test_script)
 
-    create_test_files(gen_expr_functions, test_script_path, lines)
-    create_expression_files(gen_expr_functions, test_script_path, lines)
+        create_test_files(gen_expr_functions, test_script_path, test_script)
+        create_expression_files(gen_expr_functions, test_script_path,
+                                test_script)
 
 
 def get_test_script_filename_from_command_line():
@@ -41,69 +56,113 @@ def get_test_script_filename_from_command_line():
     return test_script_filename
 
 
-def read_in_all_lines(test_script_filename):
-    with open(test_script_filename, 'r') as expr_file:
-        expressions = expr_file.read().splitlines()
-    return expressions
+def get_function_index(test_script_filename):
+    """
+    Returns the byte offsets of the functions of the test script, from its
+    sidecar .index file if the script has not changed since the index was
+    written, else from a new index, which is saved for next time.
+    """
+    index_filename = test_script_filename + '.index'
+    stat = os.stat(test_script_filename)
+    script_version = [stat.st_size, stat.st_mtime_ns]
+
+    try:
+        with open(index_filename, 'r') as index_file:
+            index = json.load(index_file)
+        if index['script'] == script_version:
+            return index['functions']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    functions_dict = index_functions(test_script_filename)
+    try:
+        with open(index_filename, 'w') as index_file:
+            json.dump({'script': script_version, 'functions': functions_dict},
+                      index_file)
+    except OSError:
+        pass
+    return functions_dict
 
 
-def find_all_functions(lines):
+def index_functions(test_script_filename):
+    """
+    Reads the test script once and returns, by function name, the byte
+    offsets of the function's opening brace line (start_offset) and of the
+    line after its closing brace (end_offset).
+    """
     functions_dict = {}
 
+    func_name_line = None
     func_name_line_no = -1
-    open_brace_line_no = -1
-
-    for line_no, line in enumerate(lines):
-        if line_is_function(line):
-            assert func_name_line_no < 0, \
-                "%s not processed." % (lines[func_name_line_no])
-            assert open_brace_line_no < 0, \
-                "%s not processed." % (lines[func_name_line_no])
-            func_name_line_no = line_no
-
-        if line_is_open_function_brace(line):
-            assert line_no == func_name_line_no+1, \
-                "%s not immediately followed by {" % (lines[func_name_line_no])
-            open_brace_line_no = line_no
-
-        if line_is_closing_function_brace(line):
-            assert func_name_line_no >= 0, \
-                "} without function."
-            assert open_brace_line_no >= 0, \
-                "%s has no {" % (lines[func_name_line_no])
-            function_name = lines[func_name_line_no][:-2]
-            # print(function_name)
-            functions_dict[function_name] = {
-                "start_line_no": open_brace_line_no,
-                "end_line_no": line_no
-            }
-            func_name_line_no = -1
-            open_brace_line_no = -1
+    open_brace_offset = -1
+
+    offset = 0
+    with open(test_script_filename, 'rb') as test_script_file:
+        for line_no, raw_line in enumerate(test_script_file):
+            line_offset = offset
+            offset += len(raw_line)
+            line = raw_line.rstrip(b'\r\n')
+
+            if line_is_function(line):
+                assert func_name_line is None, \
+                    "%s not processed." % func_name_line
+                assert open_brace_offset < 0, \
+                    "%s not processed." % func_name_line
+                func_name_line = line.decode()
+                func_name_line_no = line_no
+
+            if line_is_open_function_brace(line):
+                assert line_no == func_name_line_no+1, \
+                    "%s not immediately followed by {" % func_name_line
+                open_brace_offset = line_offset
+
+            if line_is_closing_function_brace(line):
+                assert func_name_line is not None, \
+                    "} without function."
+                assert open_brace_offset >= 0, \
+                    "%s has no {" % func_name_line
+                function_name = func_name_line[:-2]
+                functions_dict[function_name] = {
+                    "start_offset": open_brace_offset,
+                    "end_offset": offset
+                }
+                func_name_line = None
+                func_name_line_no = -1
+                open_brace_offset = -1
 
     return functions_dict
 
 
 def line_is_function(line):
-    return re.compile("^[a-zA-z_][a-zA-Z_0-9]*\(\)$").match(line)
+    return function_regex.match(line)
 
 
 def line_is_open_function_brace(line):
-    return line == "{"
+    return line == b"{"
 
 
 def line_is_closing_function_brace(line):
-    return line == "}"
+    return line == b"}"
+
+
+def read_function_lines(test_script, func):
+    """
+    Returns the lines of a function, from its opening brace to its closing
+    brace, read from the mapped test script at the function's offsets.
+    """
+    return test_script[func["start_offset"]:func["end_offset"]] \
+        .decode().splitlines()
 
 
-def get_gen_expr_functions(functions_dict, lines):
+def get_gen_expr_functions(functions_dict, test_script):
     gen_expr_functions_dict = {}
 
     run_func = functions_dict['run_generated_expression_test_cases']
     assert run_func != None, \
         "run_generated_expression_test_cases not found."
     
-    for line_no in range(run_func["start_line_no"]+1, run_func["end_line_no"]):
-        line = lines[line_no].strip()
+    for line in read_function_lines(test_script, run_func)[1:-1]:
+        line = line.strip()
         if line == "": continue
         generated_expression_func = functions_dict[line]
         assert generated_expression_func != None, \
@@ -113,7 +172,7 @@ def get_gen_expr_functions(functions_dict, lines):
     return gen_expr_functions_dict
 
 
-def create_test_files(gen_expr_functions, test_script_path, lines):
+def create_test_files(gen_expr_functions, test_script_path, test_script):
     for func_name in gen_expr_functions:
         test_full_filename = os.path.join(test_script_path,
             extract_filename_from_func_name(func_name) + '.tests')
@@ -121,22 +180,22 @@ def create_test_files(gen_expr_functions, test_script_path, lines):
         func = gen_expr_functions[func_name]
         with open(test_full_filename, 'w') as tests_file:
             tests_file.write("%s()\n" % func_name)
-            for line_no in range(func["start_line_no"], func["end_line_no"]+1):
-                tests_file.write("%s\n" % lines[line_no])
+            for line in read_function_lines(test_script, func):
+                tests_file.write("%s\n" % line)
 
 
-def create_expression_files(gen_expr_functions, test_script_path, lines):
+def create_expression_files(gen_expr_functions, test_script_path,
+                            test_script):
     for func_name in gen_expr_functions:
         test_full_filename = os.path.join(test_script_path,
             extract_filename_from_func_name(func_name))
 
         func = gen_expr_functions[func_name]
         with open(test_full_filename, 'w') as tests_file:
-            for line_no in range(func["start_line_no"]+1, func["end_line_no"]):
-                line = lines[line_no]
+            for line in read_function_lines(test_script, func)[1:-1]:
                 if "assert_is_equal" not in line:
                     continue
-                regex_result = re.search('"(.*)"', line)
+                regex_result = expression_regex.search(line)
                 assert regex_result != None, \
                     "No expression: %s" % line
                 expression = regex_result.group(1)
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+
+"""
+This Python script runs the test cases of tests-double.sh or
+tests-long-double.sh with many clc processes at a time, instead of one
+after another as the shell script does.
+
+The test script is run by sh once, with assert_is_equal and
+assert_batch_is_equal swapped for functions that only write out their
+arguments, as the shell expands them. So test cases built from variables,
+command substitutions and arithmetic are collected just as the script
+would run them, including the *" * "* case, where the expression is passed
+to clc as one argument instead of being split into words. The test cases
+are then run in a pool of worker threads, each running clc in a process of
+its own, and checked as the shell functions check them, nan and -nan being
+taken as the same answer.
+
+ASSERT FAILED lines and the totals are printed as the test script prints
+them, in the order of the test cases.
+
+With --cache, the result of each test case is kept in an sqlite database,
+keyed by the test case and the SHA-256 hash of the clc binary. Test cases
+that passed with the same clc binary are skipped, and counted as passed;
+those that failed last time are run first. With --fail-fast, the run stops
+at the first failure, so a change to clc that breaks a test case is
+reported in seconds.
+
+Run from the directory of clc and the test scripts, as tests.sh is.
+
+Syntax: ./test-tools/run-tests.py [-j n] [--cache filename] [--fail-fast]
+                                  [test_script]
+        test_script is tests-double.sh or tests-long-double.sh, by default
+        the one for the precision clc -p displays, as tests.sh picks it.
+
+Type -h or --help to see program options.
+
+Exit code:
+0 = All test cases passed.
+1 = A test case failed, or command line options displayed.
+2 = Invalid program option specified.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import getopt
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+
+clc = './clc'
+
+test_scripts = {
+    '[X] 13-15 digits  [ ] 16-19 digits': 'tests-double.sh',
+    '[ ] 13-15 digits  [X] 16-19 digits': 'tests-long-double.sh'
+}
+
+# Written to file descriptor 3, fields ended by NUL: the function name, the
+# expected exit code, the answer key, what the failure message shows of the
+# test case (for assert_batch_is_equal, the standard input of clc, as echo
+# in sh shows the input with its escapes), the number of clc arguments and
+# the arguments.
+collecting_functions = r"""assert_is_equal()
+{
+	local _expected_exit_code=$1
+	local _answer_key="$2"
+	shift 2
+	local _expression="$*"
+
+	if [ "$#" -ne 0 ]; then
+		case "$_expression" in
+			*" * "*) set -- "$_expression" ;;
+			*) set -- $_expression ;;
+		esac
+	fi
+
+	printf 'assert_is_equal\000%s\000%s\000%s\000%s\000' \
+		"$_expected_exit_code" "$_answer_key" "$_expression" "$#" >&3
+	[ "$#" -eq 0 ] || printf '%s\000' "$@" >&3
+}
+
+assert_batch_is_equal()
+{
+	local _expected_exit_code=$1
+	local _answer_key="$2"
+	local _option="$3"
+	local _input="$4"
+
+	set -- $_option
+	printf 'assert_batch_is_equal\000%s\000%s\000' \
+		"$_expected_exit_code" "$_answer_key" >&3
+	printf '%b\000%s\000' "$_input" "$#" >&3
+	[ "$#" -eq 0 ] || printf '%s\000' "$@" >&3
+}"""
+
+TestCase = namedtuple('TestCase', ['function', 'exit_code', 'answer_key',
+                                   'shown_as', 'args', 'stdin'])
+
+
+class ResultsCache():
+    """
+    Keeps the last result of each test case in an sqlite database: whether
+    it passed, and the hash of the clc binary it was run with.
+    """
+
+    def __init__(self, filename, clc_hash):
+        super(ResultsCache, self).__init__()
+        self._clc_hash = clc_hash
+        self._db = sqlite3.connect(filename)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "test_case TEXT PRIMARY KEY, clc_hash TEXT NOT NULL, "
+            "passed INTEGER NOT NULL)")
+        self._results = {
+            test_case: (clc_hash, bool(passed))
+            for test_case, clc_hash, passed in self._db.execute(
+                "SELECT test_case, clc_hash, passed FROM results")}
+
+    @staticmethod
+    def key(test_case):
+        return json.dumps(test_case)
+
+    def has_passed(self, test_case):
+        """
+        Returns whether the test case passed when last run with this clc.
+        """
+        return self._results.get(self.key(test_case)) == \
+            (self._clc_hash, True)
+
+    def has_failed(self, test_case):
+        """
+        Returns whether the test case failed when last run, with any clc.
+        """
+        result = self._results.get(self.key(test_case))
+        return result is not None and not result[1]
+
+    def put(self, test_case, passed):
+        self._db.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+            (self.key(test_case), self._clc_hash, int(passed)))
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+
+def main():
+    params = parse_cmd_line_options(sys.argv[1:])
+
+    test_script = params['test_script']
+    if test_script is None:
+        test_script = get_test_script_for_precision()
+
+    test_cases = collect_test_cases(test_script)
+
+    results_cache = None
+    num_skipped = 0
+    if params['cache_filename'] is not None:
+        results_cache = ResultsCache(params['cache_filename'], get_clc_hash())
+        test_cases = order_test_cases(test_cases, results_cache)
+        num_skipped = len(test_cases)
+        test_cases = [test_case for test_case in test_cases
+                      if not results_cache.has_passed(test_case)]
+        num_skipped -= len(test_cases)
+
+    try:
+        num_assert_run, num_assert_failed = run_test_cases(
+            test_cases, params['jobs'], params['fail_fast'], results_cache)
+    finally:
+        if results_cache is not None:
+            results_cache.close()
+
+    if num_skipped:
+        eprint("Results cache:", num_skipped,
+               "tests skipped, passed before with this clc")
+    num_assert_total = num_skipped + num_assert_run
+    print(num_assert_total, "tests,", num_assert_total - num_assert_failed,
+          "passed,", num_assert_failed, "failed.")
+    sys.exit(0 if num_assert_failed == 0 else 1)
+
+
+def get_clc_hash():
+    with open(clc, 'rb') as clc_file:
+        return hashlib.sha256(clc_file.read()).hexdigest()
+
+
+def order_test_cases(test_cases, results_cache):
+    """
+    Returns the test cases with those that failed last time first, both in
+    the order of the test script.
+    """
+    return sorted(test_cases,
+                  key=lambda test_case: not results_cache.has_failed(test_case))
+
+
+def get_test_script_for_precision():
+    precision = subprocess.run([clc, '-p'], stdout=subprocess.PIPE,
+                               universal_newlines=True).stdout.rstrip('\n')
+    if precision not in test_scripts:
+        eprint("Unknown precision:", precision)
+        sys.exit(1)
+    return test_scripts[precision]
+
+
+def collect_test_cases(test_script):
+    """
+    Returns the test cases of the test script, in order, as sh expands
+    them.
+    """
+    with open(test_script, 'r') as script_file:
+        lines = script_file.read().split('\n')
+
+    for function in ('assert_is_equal', 'assert_batch_is_equal'):
+        start = lines.index(function + '()')
+        end = lines.index('}', start) + 1
+        lines[start:end] = []
+    lines.insert(start, collecting_functions)
+
+    # Standard output of the script is thrown away; file descriptor 3 goes
+    # to ours.
+    script = 'exec 3>&1 >/dev/null\n' + '\n'.join(lines)
+    output = subprocess.run(['sh', '-s'], input=os.fsencode(script),
+                            stdout=subprocess.PIPE).stdout
+    fields = [os.fsdecode(field) for field in output.split(b'\0')[:-1]]
+
+    test_cases = []
+    pos = 0
+    while pos < len(fields):
+        function, exit_code, answer_key, shown_as, argc = fields[pos:pos+5]
+        pos += 5
+        args = fields[pos:pos+int(argc)]
+        pos += int(argc)
+        stdin = shown_as if function == 'assert_batch_is_equal' else None
+        test_cases.append(TestCase(function, exit_code, answer_key, shown_as,
+                                   tuple(args), stdin))
+    return test_cases
+
+
+def run_test_cases(test_cases, jobs, fail_fast=False, results_cache=None):
+    """
+    Runs the test cases, prints an ASSERT FAILED line for each one failing,
+    in order, and returns how many were run and how many failed. With
+    fail_fast, test cases after the first one failing are not run.
+    """
+    num_assert_run = 0
+    num_assert_failed = 0
+    with ThreadPoolExecutor(jobs) as executor:
+        futures = [executor.submit(run_test_case, test_case)
+                   for test_case in test_cases]
+        for test_case, future in zip(test_cases, futures):
+            failure = future.result()
+            num_assert_run += 1
+            if results_cache is not None:
+                results_cache.put(test_case, failure is None)
+            if failure is not None:
+                print(failure)
+                num_assert_failed += 1
+                if fail_fast:
+                    for future in futures:
+                        future.cancel()
+                    break
+    sys.stdout.flush()
+    return num_assert_run, num_assert_failed
+
+
+def run_test_case(test_case):
+    """
+    Runs clc for the test case and returns the ASSERT FAILED line the test
+    script would print, or None if it passes.
+    """
+    if test_case.stdin is None:
+        process = subprocess.run((clc,) + test_case.args,
+                                 stdin=subprocess.DEVNULL,
+                                 stdout=subprocess.PIPE)
+    else:
+        process = subprocess.run((clc,) + test_case.args,
+                                 input=os.fsencode(test_case.stdin),
+                                 stdout=subprocess.PIPE)
+    # As $(...) does, trailing newlines are removed.
+    answer = os.fsdecode(process.stdout.rstrip(b'\n'))
+    return check_answer(test_case, answer, process.returncode)
+
+
+def check_answer(test_case, answer, exit_code):
+    answer_key = test_case.answer_key
+    if test_case.function == 'assert_is_equal':
+        label = "EXPRESSION"
+        # On Linux, 0/0 gives -nan. On macOS and FreeBSD, it's nan.
+        if answer_key == '-nan':
+            answer_key = 'nan'
+        if answer == '-nan':
+            answer = 'nan'
+    else:
+        label = "BATCH INPUT"
+
+    if answer != answer_key:
+        return "ASSERT FAILED. %s: %s ANSWER: %s KEY: %s" % \
+            (label, test_case.shown_as, answer, answer_key)
+    if exit_code != int(test_case.exit_code):
+        return "ASSERT FAILED. %s: %s EXIT CODE: %d EXPECTED: %s" % \
+            (label, test_case.shown_as, exit_code, test_case.exit_code)
+    return None
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def show_help_and_exit():
+    print("Runs the test cases of a clc test script, many at a time.")
+    print()
+    print("Options:")
+    print("-j, --jobs n")
+    print("  Number of clc processes run at a time. Default: number of CPUs")
+    print("--cache filename")
+    print("  Keeps the results of test cases in sqlite database filename,")
+    print("  skips those that passed with the same clc binary, and runs")
+    print("  those that failed last time first.")
+    print("--fail-fast")
+    print("  Stops at the first test case failing.")
+    print("-h, --help")
+    print("  Displays this help screen.")
+    print()
+    print("test_script")
+    print("  tests-double.sh or tests-long-double.sh. Default: the one for")
+    print("  the precision clc -p displays.")
+    sys.exit(1)
+
+
+def show_invalid_syntax_and_exit():
+    eprint('Invalid syntax. Enter -h for help.')
+    sys.exit(2)
+
+
+def parse_cmd_line_options(argv):
+    jobs = os.cpu_count() or 1
+    cache_filename = None
+    fail_fast = False
+
+    try:
+        opts, args = getopt.getopt(argv, "j:h", ["jobs=", "cache=",
+                                                 "fail-fast", "help"])
+    except getopt.GetoptError:
+        show_invalid_syntax_and_exit()
+    for opt, arg in opts:
+        if opt in ("-j", "--jobs"):
+            if not arg.isdigit() or int(arg) < 1:
+                show_invalid_syntax_and_exit()
+            jobs = int(arg)
+        elif opt == "--cache":
+            cache_filename = arg
+        elif opt == "--fail-fast":
+            fail_fast = True
+        elif opt in ("-h", "--help"):
+            show_help_and_exit()
+    if len(args) > 1 or (args and not os.path.isfile(args[0])):
+        show_invalid_syntax_and_exit()
+
+    return {
+        'jobs': jobs,
+        'cache_filename': cache_filename,
+        'fail_fast': fail_fast,
+        'test_script': args[0] if args else None
+    }
+
+
+if __name__ == "__main__":
+    main()
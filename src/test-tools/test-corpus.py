@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+
+"""
+This Python script looks after test-cases.jsonl, the corpus of generated
+expression test cases. The generated expression test functions of
+tests-double.sh, tests-long-double.sh and tests-double.bat are written from
+it.
+
+Each line of the corpus is a JSON object for one expression:
+- category: the test function, e.g. decimal_addition for
+  run_decimal_addition_tests;
+- expression;
+- double, long_double and windows_double: the test case of the expression
+  in tests-double.sh, tests-long-double.sh and tests-double.bat:
+  answer_key, exit_code (left out if 0), full_answer_key (left out if the
+  same as answer_key), approximated (left out if false) and, for test cases
+  commented out, clc_answer, the answer clc gave. notes holds any other
+  comment lines written by hand above the test case. windows_double is left
+  out if it is the same as double.
+The lines of a category are together, in the order of the test cases.
+
+--check-oracle works out the answer keys of each double and long_double
+test case again with the exact oracle of
+create-test-cases-from-generated-expressions.py, from the answer clc gave,
+and reports those it does not give as the corpus has them. windows_double
+test cases are left out: their answer keys were set by hand, for clc on
+Windows.
+
+Syntax: ./test-corpus.py [-d dir] --import
+        ./test-corpus.py [-d dir] --generate
+        ./test-corpus.py [-d dir] --check
+        ./test-corpus.py [-d dir] --check-oracle [-c category]
+        ./test-corpus.py [-d dir] --query [-c category] [-V variant]
+                         [--commented] [--format jsonl|expressions|tests]
+
+Type -h or --help to see program options.
+
+Exit code:
+0 = Done.
+1 = Command line options displayed.
+2 = Invalid program option specified.
+3 = --check found a test script out of date, or --check-oracle an answer
+    key the exact oracle does not give.
+"""
+
+import getopt
+import importlib.util
+import io
+import json
+import os
+import re
+import sys
+
+
+def load_module(name, filename):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+ctc = load_module('test_case_creator',
+                  'create-test-cases-from-generated-expressions.py')
+
+corpus_filename = 'test-cases.jsonl'
+
+# Variant name, test script and script language.
+variants = [
+    ('double', 'tests-double.sh', 'sh'),
+    ('long_double', 'tests-long-double.sh', 'sh'),
+    ('windows_double', 'tests-double.bat', 'bat')
+]
+variant_names = [name for name, script, language in variants]
+
+key_regex = re.compile(r'^#\t +Key: (.+?)( \(approximated\))?$')
+answer_regex = re.compile(r'^#\t +Answer: (\S+)$')
+assert_regex = re.compile(r'^(#?)\tassert_is_equal (\d+) (\S+) "(.*)"$')
+bat_comment_regex = re.compile(r'^\t( *)  rem (.*)$')
+
+
+def main():
+    params = parse_cmd_line_options(sys.argv[1:])
+    src_dir = params['dir']
+    corpus_path = os.path.join(src_dir, corpus_filename)
+
+    if params['action'] == 'import':
+        write_corpus(corpus_path, import_corpus(src_dir))
+    elif params['action'] in ('generate', 'check'):
+        records = list(read_corpus(corpus_path))
+        out_of_date = []
+        for variant, script, language in variants:
+            path = os.path.join(src_dir, script)
+            if update_test_script(path, records, variant, language,
+                                  params['action'] == 'check'):
+                out_of_date.append(script)
+        if params['action'] == 'check':
+            if out_of_date:
+                print("Out of date:", ", ".join(out_of_date))
+                sys.exit(3)
+            print("Test scripts up to date.")
+    elif params['action'] == 'check-oracle':
+        records = read_category(corpus_path, params['category'])
+        num_checked, mismatches = check_oracle(records)
+        for mismatch in mismatches:
+            print(mismatch)
+        print(num_checked, "test cases,", len(mismatches),
+              "not as the exact oracle gives them.")
+        if mismatches:
+            sys.exit(3)
+    else:
+        query(corpus_path, params)
+
+    sys.exit(0)
+
+
+def category_of_function(function_name):
+    return function_name[len('run_'):-len('_tests')]
+
+
+def function_of_category(category):
+    return 'run_' + category + '_tests'
+
+
+def get_generated_functions(lines, language):
+    """
+    Returns the names of the generated expression test functions, as
+    run_generated_expression_test_cases calls them, and the range of lines
+    they take up, from the first one's name to the last one's end.
+    """
+    if language == 'sh':
+        body = lines.index('run_generated_expression_test_cases()') + 2
+        names = []
+        while lines[body] != '}':
+            if lines[body].strip() != '':
+                names.append(lines[body].strip())
+            body += 1
+        start = lines.index(names[0] + '()')
+        end = lines.index('}', lines.index(names[-1] + '()')) + 1
+    else:
+        body = lines.index(':run_generated_expression_test_cases') + 1
+        names = []
+        while lines[body] != '\texit /b':
+            if lines[body].strip() != '':
+                names.append(lines[body].strip()[len('call :'):])
+            body += 1
+        start = lines.index(':' + names[0])
+        end = lines.index('\texit /b', lines.index(':' + names[-1])) + 1
+    return names, start, end
+
+
+def function_bodies(lines, language, names, start):
+    """
+    Yields the name and the body lines, in sh, of each generated function.
+    """
+    pos = start
+    for name in names:
+        if language == 'sh':
+            assert lines[pos] == name + '()' and lines[pos+1] == '{', \
+                "%s not found." % name
+            end = lines.index('}', pos)
+            body = lines[pos+2:end]
+        else:
+            assert lines[pos] == ':' + name, "%s not found." % name
+            end = lines.index('\texit /b', pos)
+            body = [bat_line_to_sh(line) for line in lines[pos+1:end]]
+        yield name, body
+        pos = end + 1
+        while pos < len(lines) and lines[pos] == '':
+            pos += 1
+
+
+def bat_line_to_sh(line):
+    match = bat_comment_regex.match(line)
+    if match is not None:
+        line = '#\t' + match.group(1) + match.group(2)
+    return line.replace('call :assert_is_equal', 'assert_is_equal')
+
+
+def sh_line_to_bat(line):
+    line = line.replace('assert_is_equal', 'call :assert_is_equal')
+    if line.startswith('#\t'):
+        text = line[2:].lstrip(' ')
+        line = '\t' + line[2:len(line)-len(text)] + '  rem ' + text
+    return line
+
+
+def parse_test_cases(body):
+    """
+    Returns the test cases of the body lines of a generated function, as
+    written by create-test-cases-from-generated-expressions.py.
+    """
+    test_cases = []
+    full_answer_key = approximated = clc_answer = None
+    notes = []
+    for line in body:
+        if line == '':
+            continue
+        match = key_regex.match(line)
+        if match is not None:
+            full_answer_key = match.group(1)
+            approximated = match.group(2) is not None
+            continue
+        match = answer_regex.match(line)
+        if match is not None:
+            clc_answer = match.group(1)
+            continue
+        match = assert_regex.match(line)
+        if match is None:
+            assert line.startswith('#'), "Unexpected line: %s" % line
+            notes.append(line)
+            continue
+
+        expression = match.group(4)
+        test_case = {'answer_key': match.group(3)}
+        if match.group(2) != '0':
+            test_case['exit_code'] = int(match.group(2))
+        if full_answer_key is not None \
+                and full_answer_key != test_case['answer_key']:
+            test_case['full_answer_key'] = full_answer_key
+        if approximated:
+            test_case['approximated'] = True
+        if match.group(1) == '#':
+            test_case['clc_answer'] = clc_answer
+        if notes:
+            test_case['notes'] = notes
+        test_cases.append((expression, test_case))
+        full_answer_key = approximated = clc_answer = None
+        notes = []
+    return test_cases
+
+
+def import_corpus(src_dir):
+    """
+    Returns the corpus records of the generated functions of the test
+    scripts.
+    """
+    records = []
+    for variant, script, language in variants:
+        lines, line_ending = read_lines(os.path.join(src_dir, script))
+        names, start, end = get_generated_functions(lines, language)
+        index = 0
+        for name, body in function_bodies(lines, language, names, start):
+            category = category_of_function(name)
+            for expression, test_case in parse_test_cases(body):
+                if variant == variant_names[0]:
+                    records.append({'category': category,
+                                    'expression': expression})
+                record = records[index]
+                assert (record['category'], record['expression']) \
+                    == (category, expression), \
+                    "%s: %s not in %s" % (script, expression,
+                                          variant_names[0])
+                if variant != 'windows_double' \
+                        or test_case != record['double']:
+                    record[variant] = test_case
+                index += 1
+        assert index == len(records), \
+            "%s: %d test cases, not %d" % (script, index, len(records))
+    return records
+
+
+def render_function(category, test_cases, language):
+    """
+    Returns the lines of the test function of a category, written as
+    create-test-cases-from-generated-expressions.py writes it.
+    """
+    body_lines = []
+    for idx, (expression, test_case) in enumerate(test_cases):
+        answer_key = test_case['answer_key']
+        answer = (test_case.get('clc_answer', answer_key),
+                  test_case.get('exit_code', 0),
+                  test_case.get('full_answer_key', answer_key),
+                  answer_key,
+                  test_case.get('approximated', False))
+        lines = io.StringIO()
+        ctc.write_out_test_cases(lines, [expression], iter([answer]), False,
+                                 idx+1 == len(test_cases))
+        lines = lines.getvalue().split('\n')[:-1]
+        if 'notes' in test_case:
+            assert_line = [assert_regex.match(line) is not None
+                           for line in lines].index(True)
+            lines[assert_line:assert_line] = test_case['notes']
+        body_lines += lines
+
+    function_name = function_of_category(category)
+    if language == 'sh':
+        return [function_name + '()', '{'] + body_lines + ['}']
+    return [':' + function_name] + [sh_line_to_bat(line)
+                                    for line in body_lines] + ['\texit /b']
+
+
+def render_generated_functions(records, variant, language):
+    lines = []
+    separator = [''] if language == 'sh' else ['', '']
+    for category, test_cases in group_by_category(records, variant):
+        if lines:
+            lines += separator
+        lines += render_function(category, test_cases, language)
+    return lines
+
+
+def group_by_category(records, variant):
+    """
+    Yields each category with the (expression, test case) of the variant of
+    its records, in order.
+    """
+    category = None
+    test_cases = []
+    for record in records:
+        if record['category'] != category and test_cases:
+            yield category, test_cases
+            test_cases = []
+        category = record['category']
+        test_case = record.get(variant)
+        if test_case is None:
+            test_case = record['double']
+        test_cases.append((record['expression'], test_case))
+    if test_cases:
+        yield category, test_cases
+
+
+def update_test_script(path, records, variant, language, check_only):
+    """
+    Writes the generated functions of the variant into its test script,
+    unless check_only. Returns whether the script was out of date.
+    """
+    lines, line_ending = read_lines(path)
+    names, start, end = get_generated_functions(lines, language)
+    new_lines = lines[:start] \
+        + render_generated_functions(records, variant, language) \
+        + lines[end:]
+    if new_lines == lines:
+        return False
+    if not check_only:
+        with open(path, 'w', newline='') as script_file:
+            script_file.write(line_ending.join(new_lines))
+    return True
+
+
+def read_lines(path):
+    """
+    Returns the lines of the script and its line ending, \r\n for
+    tests-double.bat, which cmd.exe needs, and \n for the sh scripts.
+    """
+    with open(path, 'r', newline='') as script_file:
+        text = script_file.read()
+    line_ending = '\r\n' if '\r\n' in text else '\n'
+    return text.split(line_ending), line_ending
+
+
+def write_corpus(corpus_path, records):
+    with open(corpus_path, 'w') as corpus_file:
+        for record in records:
+            corpus_file.write(json.dumps(record, separators=(',', ':')))
+            corpus_file.write('\n')
+
+
+def read_corpus(corpus_path, start_offset=0, end_offset=None):
+    with open(corpus_path, 'rb') as corpus_file:
+        corpus_file.seek(start_offset)
+        for line in corpus_file:
+            if end_offset is not None and start_offset >= end_offset:
+                return
+            start_offset += len(line)
+            yield json.loads(line)
+
+
+def get_category_index(corpus_path):
+    """
+    Returns the byte offsets of the records of each category in the corpus,
+    from its sidecar .index file if the corpus has not changed since the
+    index was written, else from a new index, which is saved for next time.
+    """
+    index_path = corpus_path + '.index'
+    stat = os.stat(corpus_path)
+    corpus_version = [stat.st_size, stat.st_mtime_ns]
+
+    try:
+        with open(index_path, 'r') as index_file:
+            index = json.load(index_file)
+        if index['corpus'] == corpus_version:
+            return index['categories']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    categories = {}
+    offset = 0
+    with open(corpus_path, 'rb') as corpus_file:
+        for line in corpus_file:
+            category = json.loads(line)['category']
+            if category not in categories:
+                categories[category] = [offset, offset]
+            offset += len(line)
+            categories[category][1] = offset
+    try:
+        with open(index_path, 'w') as index_file:
+            json.dump({'corpus': corpus_version, 'categories': categories},
+                      index_file)
+    except OSError:
+        pass
+    return categories
+
+
+def read_category(corpus_path, category):
+    """
+    Returns the records of the category, or of the whole corpus if category
+    is None.
+    """
+    if category is None:
+        return read_corpus(corpus_path)
+    categories = get_category_index(corpus_path)
+    if category not in categories:
+        eprint("No category", category)
+        sys.exit(2)
+    return read_corpus(corpus_path, *categories[category])
+
+
+def query(corpus_path, params):
+    records = read_category(corpus_path, params['category'])
+
+    variant = params['variant']
+    if params['commented']:
+        records = (record for record in records
+                   if 'clc_answer' in record.get(variant, record['double']))
+
+    if params['format'] == 'jsonl':
+        for record in records:
+            print(json.dumps(record, separators=(',', ':')))
+    elif params['format'] == 'expressions':
+        for record in records:
+            print(record['expression'])
+    else:
+        for category, test_cases in group_by_category(records, variant):
+            print('\n'.join(render_function(category, test_cases, 'sh')))
+
+
+def check_oracle(records):
+    """
+    Returns the number of double and long_double test cases checked and a
+    line for each whose (full answer key, answer key, approximated) the
+    exact oracle does not give.
+    """
+    num_checked = 0
+    mismatches = []
+    for record in records:
+        for variant in ('double', 'long_double'):
+            test_case = record.get(variant)
+            if test_case is None:
+                continue
+            answer_key = test_case['answer_key']
+            keys = (test_case.get('full_answer_key', answer_key), answer_key,
+                    test_case.get('approximated', False))
+            oracle_keys = ctc.evaluate_expression_exactly(
+                record['expression'], test_case.get('clc_answer', answer_key))
+            if tuple(oracle_keys) != keys:
+                mismatches.append("%s: %s: %r, exact oracle %r" % (
+                    variant, record['expression'], keys, tuple(oracle_keys)))
+            num_checked += 1
+    return num_checked, mismatches
+
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+
+def show_help_and_exit():
+    print("Looks after test-cases.jsonl, the corpus of generated expression")
+    print("test cases the test scripts are written from.")
+    print()
+    print("Options:")
+    print("--import")
+    print("  Rebuilds the corpus from the generated expression test functions")
+    print("  of tests-double.sh, tests-long-double.sh and tests-double.bat.")
+    print("--generate")
+    print("  Rewrites the generated expression test functions of the test")
+    print("  scripts from the corpus.")
+    print("--check")
+    print("  Checks that the test scripts are as --generate would write them.")
+    print("--check-oracle")
+    print("  Checks that the exact oracle gives the answer keys of the")
+    print("  corpus. -c only checks one category.")
+    print("--query")
+    print("  Writes the test cases of the corpus to stdout.")
+    print("-c, --category name")
+    print("  Only queries the test cases of category name, e.g.")
+    print("  decimal_addition.")
+    print("-V, --variant double|long_double|windows_double")
+    print("  Test cases queried with --commented or --format tests.")
+    print("  Default: double")
+    print("--commented")
+    print("  Only queries the test cases commented out.")
+    print("--format jsonl|expressions|tests")
+    print("  jsonl: corpus records (default)")
+    print("  expressions: expressions, one per line")
+    print("  tests: sh test functions")
+    print("-d, --dir dir")
+    print("  Directory of the corpus and test scripts. Default: ..")
+    print("-h, --help")
+    print("  Displays this help screen.")
+    sys.exit(1)
+
+
+def show_invalid_syntax_and_exit():
+    eprint('Invalid syntax. Enter -h for help.')
+    sys.exit(2)
+
+
+def parse_cmd_line_options(argv):
+    action = None
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    category = None
+    variant = 'double'
+    commented = False
+    output_format = 'jsonl'
+
+    try:
+        opts, args = getopt.getopt(argv, "c:V:d:h",
+                                   ["import", "generate", "check", "check-oracle",
+                                    "query",
+                                    "category=", "variant=", "commented",
+                                    "format=", "dir=", "help"])
+    except getopt.GetoptError:
+        show_invalid_syntax_and_exit()
+    if args:
+        show_invalid_syntax_and_exit()
+    for opt, arg in opts:
+        if opt in ("--import", "--generate", "--check", "--check-oracle",
+                   "--query"):
+            if action is not None:
+                show_invalid_syntax_and_exit()
+            action = opt[2:]
+        elif opt in ("-c", "--category"):
+            category = arg
+        elif opt in ("-V", "--variant"):
+            if arg not in variant_names:
+                show_invalid_syntax_and_exit()
+            variant = arg
+        elif opt == "--commented":
+            commented = True
+        elif opt == "--format":
+            if arg not in ('jsonl', 'expressions', 'tests'):
+                show_invalid_syntax_and_exit()
+            output_format = arg
+        elif opt in ("-d", "--dir"):
+            if not os.path.isdir(arg):
+                show_invalid_syntax_and_exit()
+            src_dir = arg
+        elif opt in ("-h", "--help"):
+            show_help_and_exit()
+    if action is None:
+        show_invalid_syntax_and_exit()
+
+    return {
+        'action': action,
+        'dir': src_dir,
+        'category': category,
+        'variant': variant,
+        'commented': commented,
+        'format': output_format
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -72,7 +72,7 @@ exit /b
 
 
 :run_help_test_cases
-	set _usage="Usage: clc expression_Command-line elementary arithmetic calculator, version 1.0.0_Expression can contain +, -, *, x, /, (), and []._Examples:_  clc (8 + 5) / [14 - 14 + 1]   Answer: 13_  clc 1 + 14 / 4                Answer: 4.5_  clc 16 / 8 - 21               Answer: -19_  clc 3141592653/(10000*100000) Answer: 3.141592653"
+	set _usage="Usage: clc expression_       clc -b_Command-line elementary arithmetic calculator, version 1.0.0_Expression can contain +, -, *, x, /, (), and []._-b, --batch: evaluates one expression per line of standard input_and writes one answer or error per line._Examples:_  clc (8 + 5) / [14 - 14 + 1]   Answer: 13_  clc 1 + 14 / 4                Answer: 4.5_  clc 16 / 8 - 21               Answer: -19_  clc 3141592653/(10000*100000) Answer: 3.141592653"
 
 	call :assert_is_equal 0 %_usage% "-h"
 	call :assert_is_equal 0 %_usage% "-h ignored"
@@ -2140,7 +2140,7 @@ exit /b
 	call :assert_is_equal 0 -5268618 "12336 + 57 + 5825 + -40+8 + -433+(-66 + -268+4) + 30+[-219 + 4921+153 + 2818] + -8231+(-489) + -454+9472+[-169]+704+1604+993 + -25+[-689] + 956+950+(-120+12+280 + 59+(-4789+2497 + -6982)+58+15+[-2] + 377)+[-48 + 9425 + -5299148]"
 
 	               rem Key: 8.9540948995006074e+16
-	call :assert_is_equal 0 8.9540948995006e+16 "-769+[-64 + 816+[-711]+194+973+(-3580+[-63251+89540948994457486])]+23+[-452] + 915 + -661 + -53181 + -41 + 4750+168+(-6) + 77 + 209 + -371+(-41) + 876+5477 + 3881 + 0 + 268 + -5832 + -57 + 332+[-74 + 655626+2724+[-49]]+540 + -121"
+	call :assert_is_equal 0 8.95409489950061e+16 "-769+[-64 + 816+[-711]+194+973+(-3580+[-63251+89540948994457486])]+23+[-452] + 915 + -661 + -53181 + -41 + 4750+168+(-6) + 77 + 209 + -371+(-41) + 876+5477 + 3881 + 0 + 268 + -5832 + -57 + 332+[-74 + 655626+2724+[-49]]+540 + -121"
 
 	call :assert_is_equal 0 -8340402333594 "7 + 339 + -382+[-21378 + 784+[-6914 + 12865]]+771+90 + -16 + 29+(-990 + 308 + -8340402469488) + 1913 + -351 + 0+146952 + 297+[-17]+3867+(-55) + 5547 + -4295+7904 + -8270 + 589+[-5951]+[-8934] + 215+43+[-49+[-89]+49+42]+4588 + 6386"
 	call :assert_is_equal 0 -380465 "9373+24+(-95)+(-6 + -30 + -65+(-27109+[-633018]) + -370+4059+58720+202187+9414 + -406+85 + -73 + -925) + 4953 + 40 + 529+(-7835 + 844 + -1933+72 + -85)+649 + -299 + -2726+(-707+7302 + -92)+(-3458 + 57 + 92 + -713 + -78) + -284+1442"
@@ -41,6 +41,28 @@ assert_is_equal()
 	num_assert_total=$((num_assert_total+1))
 }
 
+assert_batch_is_equal()
+{
+	local _expected_exit_code=$1
+	local _answer_key="$2"
+	local _option="$3"
+	local _input="$4"
+
+	local _answer
+	_answer=$(printf '%b' "$_input" | ./clc $_option)
+	local _exit_code=$?
+
+	if [ "$_answer" != "$_answer_key" ]; then
+		echo "ASSERT FAILED. BATCH INPUT: $_input ANSWER: $_answer KEY: $_answer_key"
+		num_assert_failed=$((num_assert_failed+1))
+	elif [ "$_exit_code" -ne "$_expected_exit_code" ]; then
+		echo "ASSERT FAILED. BATCH INPUT: $_input EXIT CODE: $_exit_code EXPECTED: $_expected_exit_code"
+		num_assert_failed=$((num_assert_failed+1))
+	fi
+
+	num_assert_total=$((num_assert_total+1))
+}
+
 run_no_expression_test_cases()
 {
 	local _missing_expression=
@@ -59,7 +81,7 @@ run_no_expression_test_cases()
 run_help_test_cases()
 {
 	local _usage=
-	_usage=$(printf "Usage: clc expression\nCommand-line elementary arithmetic calculator, version 1.0.0\n\nExpression can contain +, -, *, x, /, (), and [].\n\nExamples:\n  clc (8 + 5) / [14 - 14 + 1]   Answer: 13\n  clc 1 + 14 / 4                Answer: 4.5\n  clc 16 / 8 - 21               Answer: -19\n  clc 3141592653/(10000*100000) Answer: 3.141592653")
+	_usage=$(printf "Usage: clc expression\n       clc -b\nCommand-line elementary arithmetic calculator, version 1.0.0\n\nExpression can contain +, -, *, x, /, (), and [].\n-b, --batch: evaluates one expression per line of standard input\nand writes one answer or error per line.\n\nExamples:\n  clc (8 + 5) / [14 - 14 + 1]   Answer: 13\n  clc 1 + 14 / 4                Answer: 4.5\n  clc 16 / 8 - 21               Answer: -19\n  clc 3141592653/(10000*100000) Answer: 3.141592653")
 
 	assert_is_equal 0 "$_usage" "-h"
 	assert_is_equal 0 "$_usage" "-h ignored"
@@ -172,6 +194,32 @@ run_expression_buffer_test_cases()
 	assert_is_equal 1 "$_buffer_too_small" "$_almost_longest_expression + 01 +"
 }
 
+run_batch_test_cases()
+{
+	local _invalid_expression_line="clc: invalid elementary arithmetic expression"
+	local _buffer_too_small="Expression buffer too small."
+
+	assert_batch_is_equal 0 "" "-b" ""
+	assert_batch_is_equal 0 "2" "-b" "1+1\n"
+	assert_batch_is_equal 0 "2" "-b" "1+1"
+	assert_batch_is_equal 0 "2" "-b" "1+1\r\n"
+	assert_batch_is_equal 0 "2" "-b ignored" "1+1\n"
+	assert_batch_is_equal 0 "2" "--batch" "1+1\n"
+	assert_batch_is_equal 0 "$(printf "2\n6\n1.32\n-5")" "-b" "1+1\n2 * 3\n[(1+2)*3-0.2]/20x3\n-5\n"
+	assert_batch_is_equal 0 "$(printf "inf\n-inf")" "-b" "1/0\n-1/0\n"
+
+	assert_batch_is_equal 1 "$_invalid_expression_line" "-b" "\n"
+	assert_batch_is_equal 1 "$_invalid_expression_line" "-b" " \n"
+	assert_batch_is_equal 1 "$(printf "2\n%s\n4" "$_invalid_expression_line")" "-b" "1+1\n1+\n2+2\n"
+	assert_batch_is_equal 1 "$(printf "%s\n%s\n3" "$_invalid_expression_line" "$_invalid_expression_line")" "-b" "--1\n1+()\n1+2\n"
+
+	local _buffer_size=511
+	local _longest_expression=$(printf %$((_buffer_size-1))s1 | sed 's/  /1+/g')
+	assert_batch_is_equal 0 "$(((_buffer_size+1)/2))" "-b" "$_longest_expression\n"
+	assert_batch_is_equal 1 "$(printf "%s\n2" "$_buffer_too_small")" "-b" "X$_longest_expression\n1+1\n"
+	assert_batch_is_equal 1 "$_buffer_too_small" "-b" "X$_longest_expression"
+}
+
 run_read_expression_test_cases()
 {
 	assert_is_equal 0 6 "2 * 3"
@@ -2107,7 +2155,7 @@ run_integer_addition_tests()
 	assert_is_equal 0 -5268618 "12336 + 57 + 5825 + -40+8 + -433+(-66 + -268+4) + 30+[-219 + 4921+153 + 2818] + -8231+(-489) + -454+9472+[-169]+704+1604+993 + -25+[-689] + 956+950+(-120+12+280 + 59+(-4789+2497 + -6982)+58+15+[-2] + 377)+[-48 + 9425 + -5299148]"
 
 #	             Key: 8.9540948995006074e+16
-	assert_is_equal 0 8.9540948995006e+16 "-769+[-64 + 816+[-711]+194+973+(-3580+[-63251+89540948994457486])]+23+[-452] + 915 + -661 + -53181 + -41 + 4750+168+(-6) + 77 + 209 + -371+(-41) + 876+5477 + 3881 + 0 + 268 + -5832 + -57 + 332+[-74 + 655626+2724+[-49]]+540 + -121"
+	assert_is_equal 0 8.95409489950061e+16 "-769+[-64 + 816+[-711]+194+973+(-3580+[-63251+89540948994457486])]+23+[-452] + 915 + -661 + -53181 + -41 + 4750+168+(-6) + 77 + 209 + -371+(-41) + 876+5477 + 3881 + 0 + 268 + -5832 + -57 + 332+[-74 + 655626+2724+[-49]]+540 + -121"
 
 	assert_is_equal 0 -8340402333594 "7 + 339 + -382+[-21378 + 784+[-6914 + 12865]]+771+90 + -16 + 29+(-990 + 308 + -8340402469488) + 1913 + -351 + 0+146952 + 297+[-17]+3867+(-55) + 5547 + -4295+7904 + -8270 + 589+[-5951]+[-8934] + 215+43+[-49+[-89]+49+42]+4588 + 6386"
 	assert_is_equal 0 -380465 "9373+24+(-95)+(-6 + -30 + -65+(-27109+[-633018]) + -370+4059+58720+202187+9414 + -406+85 + -73 + -925) + 4953 + 40 + 529+(-7835 + 844 + -1933+72 + -85)+649 + -299 + -2726+(-707+7302 + -92)+(-3458 + 57 + 92 + -713 + -78) + -284+1442"
@@ -28776,6 +28824,7 @@ run_input_output_test_cases()
 	run_display_precision_test_cases
 
 	run_expression_buffer_test_cases
+	run_batch_test_cases
 
 	run_read_expression_test_cases
 	run_bad_expression_test_cases